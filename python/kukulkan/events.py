@@ -1,24 +1,122 @@
-"""A simple publisher-observer implementation for event handling."""
+"""A simple publisher-observer implementation for event handling.
 
-import logging
+Events are named by dotted topics, like ``config.ui.changed``. A
+subscription matches topics with a pattern, in which a segment can be
+a wildcard:
+
+    * ``*`` matches exactly one segment: ``config.*.changed``.
+    * ``**`` matches any number of segments, even none: ``graph.node.**``.
 
-from collections import defaultdict
+Patterns are stored in a prefix tree. The subscribers of each notified
+topic are looked up once, then cached until the subscriptions change.
+"""
+
+import itertools
+import logging
 
 
 log = logging.getLogger(__name__)
-publishers = defaultdict(list)
+
+
+class _Topic(object):
+    """A node of the prefix tree of the subscribed patterns."""
+
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        self.children = {}
+        self.subscribers = []
+
+
+_root = _Topic()
+# Subscribers of each notified topic, in subscription order.
+_subscribers = {}
+_order = itertools.count()
 
 
 def subscribe(func, name):
     """Subscribe to a publisher.
 
     :param func: Callable subscribing.
-    :param name: Name of the publisher to observe.
+    :param name: Name of the publisher to observe, or a pattern of names
+                 using ``*`` and ``**`` segments.
     :type func: callable
     :type name: str
     """
-    publishers[name].append(func)
-    log.info('{} subscribed to {}.'.format(func.__name__, name))
+    topic = _root
+    for segment in name.split('.'):
+        topic = topic.children.setdefault(segment, _Topic())
+    topic.subscribers.append((next(_order), func))
+    _subscribers.clear()
+    log.info('%s subscribed to %s.', _name(func), name)
+
+
+def unsubscribe(func, name):
+    """Stop a subscription made with `subscribe`.
+
+    :param func: Callable subscribed.
+    :param name: Name or pattern it subscribed to.
+    :type func: callable
+    :type name: str
+    :raise ValueError: If the callable is not subscribed to the name.
+    """
+    topic = _root
+    for segment in name.split('.'):
+        topic = topic.children.get(segment)
+        if topic is None:
+            break
+    else:
+        for index, (_, subscriber) in enumerate(topic.subscribers):
+            if subscriber == func:
+                del topic.subscribers[index]
+                _subscribers.clear()
+                log.info('%s unsubscribed from %s.', _name(func), name)
+                return
+    err = '{} is not subscribed to {}.'.format(_name(func), name)
+    raise ValueError(err)
+
+
+def subscribers(name):
+    """Return the callables notified by a publisher, in subscription order.
+
+    :param name: Name of the publisher.
+    :type name: str
+    :rtype: tuple
+    """
+    funcs = _subscribers.get(name)
+    if funcs is None:
+        found = {}
+        _match(_root, name.split('.'), 0, found)
+        funcs = tuple(found[order] for order in sorted(found))
+        _subscribers[name] = funcs
+    return funcs
+
+
+def _match(topic, segments, index, found):
+    """Collect the subscribers of the patterns matching some segments.
+
+    :param _Topic topic: Node of the tree matching the previous segments.
+    :param list segments: Segments of the notified name.
+    :param int index: Index of the next segment to match.
+    :param dict found: Subscribers found, by subscription order.
+    """
+    children = topic.children
+    deep = children.get('**')
+    if deep is not None:
+        for rest in xrange(index, len(segments) + 1):
+            _match(deep, segments, rest, found)
+    if index == len(segments):
+        found.update(topic.subscribers)
+        return
+    for key in (segments[index], '*'):
+        child = children.get(key)
+        if child is not None:
+            _match(child, segments, index + 1, found)
+
+
+def _name(func):
+    """Return the name of a callable, for logging."""
+    return getattr(func, '__name__', func)
 
 
 def notify(name, *args, **kwargs):
@@ -27,9 +125,16 @@ def notify(name, *args, **kwargs):
     :param name: Name of the publisher emitting.
     :type name: str
     """
-    if name not in publishers:
+    funcs = _subscribers.get(name)
+    if funcs is None:
+        funcs = subscribers(name)
+    if not funcs:
+        return
+    if not log.isEnabledFor(logging.INFO):
+        for func in funcs:
+            func(*args, **kwargs)
         return
-    log.info('Emitted {}:'.format(name))
-    for func in publishers[name]:
+    log.info('Emitted %s:', name)
+    for func in funcs:
         func(*args, **kwargs)
-        log.info('\t{} was notified.'.format(func.__name__))
+        log.info('\t%s was notified.', _name(func))
@@ -1,77 +1,549 @@
+import contextlib
+import copy
+import itertools
+import time
 import uuid
+import weakref
 from collections import MutableSequence
-from functools import wraps
+from multiprocessing.pool import ThreadPool
 
-is_dirty = False
+import numpy
 
+import kukulkan.events
+import kukulkan.graph.batch
+import kukulkan.graph.compiler
+import kukulkan.graph.frames
+import kukulkan.graph.names
+import kukulkan.graph.order
+import kukulkan.graph.parallel
+import kukulkan.graph.storage
 
-def set_dirty(f):
-    """Set the current graph dirty.
-    """
-    global is_dirty
-
-    @wraps(f)
-    def inner(*args, **kwargs):
-        return f(*args, **kwargs)
 
-    is_dirty = True
+_ids = itertools.count()
 
-    return inner
 
+def reserve_ids(count):
+    """Reserve a range of consecutive ids.
 
-def set_clean(f):
-    """Set the current graph clean.
+    :param int count: Number of ids to reserve.
+    :return: The first reserved id.
+    :rtype: int
     """
-    global is_dirty
+    global _ids
+    first = next(_ids)
+    _ids = itertools.count(first + count)
+    return first
+
 
-    @wraps(f)
-    def inner(*args, **kwargs):
-        return f(*args, **kwargs)
+# Shared by every unconnected attribute, never mutated.
+_NO_CONNECTIONS = {}
 
-    is_dirty = False
 
-    return inner
+def _adjacency(edges):
+    """Return a function listing the nodes linked to a node in a dict.
+
+    Used instead of bound methods of the graph, which the order of the
+    graph would keep alive.
+    """
+    return lambda node: edges[node].keys()
 
 
 class Unique(object):
+    """An object identified by a cheap integer id.
+
+    The `uuid` is only generated the first time it is requested, for
+    example when the object gets serialized.
+    """
+
+    __slots__ = ('id', '_uuid', '__weakref__')
 
     def __init__(self):
-        self.uuid = uuid.uuid4()
+        self.id = next(_ids)
+        self._uuid = None
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name != '__weakref__' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+    @property
+    def uuid(self):
+        """Return the universally unique identifier of this object.
+
+        :rtype: uuid.UUID
+        """
+        if self._uuid is None:
+            self._uuid = uuid.uuid4()
+        return self._uuid
+
+    @uuid.setter
+    def uuid(self, value):
+        self._uuid = value
 
 
 class Graph(Unique):
     """A `Graph` containing `Node` items.
+
+    Changes made on the graph are published through `kukulkan.events`,
+    with the graph as first argument:
+
+        * ``graph.node.added``, ``graph.node.removed``: the node.
+        * ``graph.attribute.added``, ``graph.attribute.removed``: the
+          attribute.
+        * ``graph.connection.added``, ``graph.connection.removed``: the
+          source and destination attributes.
+        * ``graph.attribute.changed``: the attribute and its previous
+          value.
+        * ``graph.node.renamed``: the node and its previous name.
+        * ``graph.item.inserted``, ``graph.item.removed``: the
+          `AttributeList`, the index of the item and the item.
     """
 
     def __init__(self):
         super(Graph, self).__init__()
         self.nodes = {}
+        self.names = kukulkan.graph.names.NameIndex()
+        self.dirty_nodes = set()
+        self._upstream = {}
+        self._downstream = {}
+        self.order = kukulkan.graph.order.TopologicalOrder(
+            _adjacency(self._upstream),
+            _adjacency(self._downstream),
+        )
+        self._schedule = None
+        self._regions = {}
+        self.topology = 0
+        self._batch = None
+        self.stores = {}
+        self.listeners = []
+        self.profiler = None
 
     def __str__(self):
         return '\n'.join(map(str, self.nodes.values()))
 
+    def notify(self, name, *args):
+        """Publish a change of this graph.
+
+        During a `Graph.batch`, the notification is stored and sent
+        when the batch is committed.
+
+        :param str name: Name of the event.
+        """
+        if self._batch is not None:
+            self._batch.events.append((name, args))
+        else:
+            self.publish(name, *args)
+
+    def publish(self, name, *args):
+        """Send a notification to the listeners of this graph, then to
+        the event subscribers.
+
+        Listeners are callables taking the event name and its arguments,
+        used by the objects following the changes of a single graph,
+        like a `kukulkan.graph.journal.Journal`.
+
+        :param str name: Name of the event.
+        """
+        for listener in self.listeners:
+            listener(name, *args)
+        kukulkan.events.notify(name, self, *args)
+
+    def store(self, attribute_class):
+        """Return the store keeping the values of an attribute class.
+
+        The store is created the first time it is requested.
+
+        :param attribute_class: A `kukulkan.graph.attributes.matrix.Matrix`
+                                class.
+        :rtype: kukulkan.graph.storage.MatrixStore
+        """
+        store = self.stores.get(attribute_class)
+        if store is None:
+            store = kukulkan.graph.storage.MatrixStore(
+                attribute_class.shape,
+                attribute_class.dtype,
+            )
+            self.stores[attribute_class] = store
+        return store
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Group changes made on this graph in a transaction.
+
+        Inside the transaction, dirty propagation and notifications are
+        deferred, then applied once when it ends.
+        Values read inside the transaction may therefore be outdated.
+        If an exception is raised, even a `KeyboardInterrupt`, the changes
+        are rolled back and no notification is sent.
+
+        Nested transactions are merged in the outermost one.
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        batch = self._batch = kukulkan.graph.batch.Batch()
+        try:
+            yield batch
+        except BaseException:
+            self._batch = None
+            self._rollback(batch)
+            raise
+        finally:
+            self._batch = None
+        batch.commit(self)
+
+    def _rollback(self, batch):
+        """Undo the changes of a batch without sending notifications."""
+        with self.muted():
+            batch.rollback(self)
+
+    @contextlib.contextmanager
+    def muted(self):
+        """Change this graph without sending notifications.
+
+        Used for changes that do not come from the user, like undoing a
+        batch or building nodes that are loaded lazily.
+        """
+        outer = self._batch
+        muted = self._batch = kukulkan.graph.batch.Batch()
+        try:
+            yield
+        finally:
+            self._batch = outer
+            for attribute in muted.dirty:
+                attribute.set_dirty()
+
     def add_node(self, node):
         """Add an existing node to this graph.
 
         :param Node node: `Node` to add.
         :return: The node added
         :rtype: Node
+        :raise ValueError: If the node connections would create a cycle.
         """
-        self.nodes[node.uuid] = node
+        upstream = {}
+        downstream = {}
+        for attribute in node.iter_attributes():
+            for other in attribute.inputs.itervalues():
+                if other.node in self.order:
+                    upstream[other.node] = upstream.get(other.node, 0) + 1
+            for other in attribute.iter_outputs():
+                if other.node in self.order:
+                    downstream[other.node] = downstream.get(other.node, 0) + 1
+        # The order walks the adjacency index, which must know the node.
+        self.order.add(node)
+        self._upstream[node] = upstream
+        self._downstream[node] = downstream
+        for other, count in upstream.iteritems():
+            self._downstream[other][node] = count
+        for other, count in downstream.iteritems():
+            self._upstream[other][node] = count
+        try:
+            for other in downstream:
+                self.order.add_edge(node, other)
+        except ValueError:
+            for other in upstream:
+                del self._downstream[other][node]
+            for other in downstream:
+                del self._upstream[other][node]
+            del self._upstream[node]
+            del self._downstream[node]
+            self.order.remove(node)
+            raise
+        self.nodes[node.id] = node
+        self.names.add(node)
+        node.graph = self
+        for attribute in node.iter_attributes():
+            attribute.attach(self)
+        if node.dirty:
+            self.dirty_nodes.add(node)
+        self.invalidate_schedule()
+        self.notify('graph.node.added', node)
+        return node
 
     def remove_node(self, node):
         """Remove a node from the graph.
 
-        :param Node node: `Node` or uuid of the node to remove.
+        The attributes of the node are disconnected first, only the
+        connections of the node are visited.
+
+        :param Node node: `Node` or id of the node to remove.
 
         :return: The node removed.
         :rtype: Node
         """
         if isinstance(node, Node):
-            node = node.uuid
-        if uuid not in self.nodes:
+            node = node.id
+        if node not in self.nodes:
             raise KeyError('Node {} does not exist.'.format(node))
-        return self.nodes.pop(uuid)
+        node = self.nodes[node]
+        for attribute in node.iter_attributes():
+            for other in attribute.inputs.values():
+                other.disconnect(attribute)
+            for other in list(attribute.iter_outputs()):
+                attribute.disconnect(other)
+        del self.nodes[node.id]
+        self.names.remove(node)
+        node.graph = None
+        for attribute in node.iter_attributes():
+            attribute.detach()
+        self.order.remove(node)
+        del self._upstream[node]
+        del self._downstream[node]
+        self.dirty_nodes.discard(node)
+        self._release_regions(node)
+        self.invalidate_schedule()
+        self.notify('graph.node.removed', node)
+        return node
+
+    def _release_regions(self, node):
+        """Forget the compiled regions referencing a removed node.
+
+        Regions of specific nodes including it are dropped from the
+        cache, the region of the whole graph is compiled again when
+        evaluated next.
+        """
+        for key, region in self._regions.items():
+            if key is None:
+                region.release()
+            elif node in key:
+                del self._regions[key]
+                region.release()
+
+    def upstream(self, node):
+        """Return the nodes of this graph driving the specified node.
+
+        :param Node node: Node of this graph.
+        :rtype: list(Node)
+        """
+        return self._upstream[node].keys()
+
+    def downstream(self, node):
+        """Return the nodes of this graph driven by the specified node.
+
+        In a graph loaded lazily, the nodes driven are built first.
+
+        :param Node node: Node of this graph.
+        :rtype: list(Node)
+        """
+        self._load_downstream(node)
+        return self._downstream[node].keys()
+
+    def _load_downstream(self, node):
+        """Build the nodes driven by a node, in a graph loaded lazily."""
+        load_downstream = getattr(self.nodes, 'load_downstream', None)
+        if load_downstream is not None:
+            load_downstream(node.id)
+
+    def _link(self, source, destination):
+        """Count a connection going from a node to another one."""
+        downstream = self._downstream[source]
+        downstream[destination] = downstream.get(destination, 0) + 1
+        upstream = self._upstream[destination]
+        upstream[source] = upstream.get(source, 0) + 1
+
+    def _unlink(self, source, destination):
+        """Forget a connection going from a node to another one."""
+        for edges, key in (
+            (self._downstream[source], destination),
+            (self._upstream[destination], source),
+        ):
+            if edges[key] == 1:
+                del edges[key]
+            else:
+                edges[key] -= 1
+
+    def find(self, name):
+        """Return the nodes with the specified name.
+
+        :param str name: Name of the nodes to find.
+        :rtype: list(Node)
+        """
+        return self.search(name, 'exact')
+
+    def search(self, pattern, kind='glob'):
+        """Return the nodes whose name matches a pattern.
+
+        :param str pattern: Pattern to look for, like ``L_arm_*_ctrl``.
+        :param str kind: One of ``exact``, ``prefix``, ``glob`` or
+                         ``regex``, see `kukulkan.graph.names`.
+        :rtype: list(Node)
+        """
+        load_matching = getattr(self.nodes, 'load_matching', None)
+        if load_matching is not None:
+            load_matching(pattern, kind)
+        return self.names.find(pattern, kind)
+
+    def resolve(self, path):
+        """Return the attribute at the specified path.
+
+        Paths are made of the node name and the attribute name, like
+        ``arm_ctrl.xform``. Items of an `AttributeList` are accessed by
+        index, like ``skin.weights[2]``.
+
+        :param str path: Path of the attribute.
+        :rtype: Attribute
+        :raise KeyError: If the node or the attribute does not exist.
+        :raise ValueError: If several nodes have the name of the path.
+        """
+        node_name, _, name = path.rpartition('.')
+        nodes = self.find(node_name)
+        if not nodes:
+            raise KeyError('Node {} does not exist.'.format(node_name))
+        if len(nodes) > 1:
+            err = 'Several nodes are named {}.'.format(node_name)
+            raise ValueError(err)
+        index = None
+        if name.endswith(']'):
+            name, _, index = name[:-1].partition('[')
+        attribute = nodes[0].attribute_names.get(name)
+        if attribute is None:
+            raise KeyError('Attribute {} does not exist.'.format(path))
+        if index is not None:
+            try:
+                attribute = attribute[int(index)]
+            except (IndexError, ValueError):
+                raise KeyError('Attribute {} does not exist.'.format(path))
+        return attribute
+
+    def invalidate_schedule(self):
+        """Discard the cached evaluation schedule.
+
+        Called whenever a node, an attribute or a connection is added or
+        removed. Compiled regions are generated again when they are next
+        evaluated.
+        """
+        self._schedule = None
+        self.topology += 1
+
+    def compile(self, nodes=None):
+        """Return the compiled region evaluating the specified nodes.
+
+        Regions are cached by set of nodes, until one of their nodes
+        is removed.
+
+        :param nodes: Nodes of the region, every node by default.
+        :rtype: kukulkan.graph.compiler.Region
+        """
+        key = None if nodes is None else frozenset(nodes)
+        region = self._regions.get(key)
+        if region is None:
+            region = kukulkan.graph.compiler.Region(self, nodes)
+            self._regions[key] = region
+        return region
+
+    def evaluate_frames(self, inputs, outputs):
+        """Evaluate this graph for every frame of the specified inputs.
+
+        See `kukulkan.graph.frames.evaluate_frames`.
+
+        :param dict inputs: Values of unconnected attributes, by attribute,
+                            as arrays with one item per frame.
+        :param list outputs: Attributes to return the values of.
+        :return: Values of the outputs, by attribute, as arrays with one
+                 item per frame.
+        :rtype: dict
+        """
+        return kukulkan.graph.frames.evaluate_frames(self, inputs, outputs)
+
+    def schedule(self):
+        """Return the nodes of this graph in evaluation order.
+
+        Nodes are topologically sorted, every node coming after the
+        nodes driving its attributes.
+        The order is computed once and cached until the topology of the
+        graph changes.
+
+        :rtype: list(Node)
+        """
+        if self._schedule is None:
+            self._schedule = self.order.sort(self.nodes.itervalues())
+        return self._schedule
+
+    def evaluate(self):
+        """Evaluate every dirty `Node` of this graph.
+
+        Dirty nodes are run in the order of `Graph.schedule`, so that
+        their inputs are always clean when they pull them.
+        Clean nodes are skipped, so the cost of an evaluation only
+        depends on the part of the graph affected by the last changes.
+        """
+        if not self.dirty_nodes:
+            return
+        if len(self.dirty_nodes) * 2 > len(self.nodes):
+            nodes = self.schedule()
+        else:
+            nodes = self.order.sort(self.dirty_nodes)
+        for node in nodes:
+            if node.dirty:
+                node.update()
+
+    def waves(self):
+        """Group the dirty nodes in waves of independent nodes.
+
+        Nodes of a wave only depend on nodes of the previous waves, so
+        they can be run concurrently.
+
+        :rtype: list(list(Node))
+        """
+        nodes = self.order.sort(self.dirty_nodes)
+        depths = {}
+        waves = []
+        for node in nodes:
+            depth = 0
+            for upstream in self.upstream(node):
+                if upstream in depths:
+                    depth = max(depth, depths[upstream] + 1)
+            depths[node] = depth
+            if depth == len(waves):
+                waves.append([])
+            waves[depth].append(node)
+        return waves
+
+    def evaluate_parallel(self, pool):
+        """Evaluate every dirty `Node`, running independent ones concurrently.
+
+        A `multiprocessing.pool.ThreadPool` runs the nodes in place.
+        Any other `multiprocessing.Pool` runs a pickled copy of each
+        node, without its connections, and the resulting values are
+        copied back on the original nodes.
+
+        :param pool: Pool used to run the nodes of each wave.
+        :type pool: multiprocessing.pool.Pool
+        :return: Statistics about the parallelism achieved.
+        :rtype: kukulkan.graph.parallel.EvaluationReport
+        """
+        start = time.time()
+        waves = self.waves()
+        busy = 0.0
+        for wave in waves:
+            for node in wave:
+                node.pull()
+            if isinstance(pool, ThreadPool):
+                durations = pool.map(kukulkan.graph.parallel.run, wave)
+            else:
+                results = pool.map(kukulkan.graph.parallel.run_detached, wave)
+                durations = []
+                for node, (values, started, duration) in zip(wave, results):
+                    for attribute in node.iter_attributes():
+                        attribute.value = values[attribute.id]
+                    if self.profiler is not None:
+                        self.profiler.record(node, started, duration)
+                    durations.append(duration)
+            for node in wave:
+                node.clean()
+            busy += sum(durations)
+        widths = map(len, waves)
+        wall = time.time() - start
+        return kukulkan.graph.parallel.EvaluationReport(widths, busy, wall)
 
 
 class Node(Unique):
@@ -79,16 +551,59 @@ class Node(Unique):
 
     builtin_attributes = {}
 
+    # Whether `Node.run` accepts values with a leading frame axis, see
+    # `kukulkan.graph.frames`.
+    batched = False
+
     def __init__(self, name):
         super(Node, self).__init__()
         self.attributes = {}
         self.attribute_names = {}
-        self.name = name
+        self._name = name
+        self._graph = None
+        self.dirty = True
         self._generate_builtin_attributes()
 
     def __str__(self):
         return str(self.name)
 
+    @property
+    def name(self):
+        """Return the name of this node.
+
+        :rtype: str
+        """
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        old_name = self._name
+        self._name = name
+        if self.graph is not None:
+            self.graph.names.rename(self, old_name)
+            self.graph.notify('graph.node.renamed', self, old_name)
+
+    @property
+    def graph(self):
+        """Return the graph of this node.
+
+        The graph owns its nodes, nodes only keep a weak reference to it.
+
+        :rtype: Graph or None
+        """
+        if self._graph is None:
+            return None
+        return self._graph()
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = None if graph is None else weakref.ref(graph)
+
+    def __getstate__(self):
+        state = super(Node, self).__getstate__()
+        state['_graph'] = None
+        return state
+
     def _generate_builtin_attributes(self):
         """Generate built-in attributes of this `Node`."""
         attrs = self.builtin_attributes.iteritems()
@@ -108,31 +623,348 @@ class Node(Unique):
             err = 'Attribute {} already exists.'.format(name)
             raise KeyError(err)
         attribute = attribute_class(name, self)
-        setattr(self, name, attribute)
-        self.attributes[attribute.uuid] = attribute
-        self.attribute_names[name] = attribute
+        self._insert_attribute(attribute)
+        return attribute
+
+    def _insert_attribute(self, attribute):
+        """Register an attribute created for this node."""
+        setattr(self, attribute.name, attribute)
+        self.attributes[attribute.id] = attribute
+        self.attribute_names[attribute.name] = attribute
+        self.set_dirty()
+        if self.graph is not None:
+            for item in self._items(attribute):
+                item.attach(self.graph)
+            self.graph.invalidate_schedule()
+            self.graph.notify('graph.attribute.added', attribute)
+
+    def remove_attribute(self, name):
+        """Remove an attribute from this node.
+
+        The attribute is disconnected first.
+
+        :param str name: Name of the attribute to remove.
+        :return: The attribute removed.
+        :rtype: Attribute
+        """
+        if name not in self.attribute_names:
+            err = 'Attribute {} does not exist.'.format(name)
+            raise KeyError(err)
+        attribute = self.attribute_names[name]
+        for item in self._items(attribute):
+            for other in item.inputs.values():
+                other.disconnect(item)
+            for other in list(item.iter_outputs()):
+                item.disconnect(other)
+            item.detach()
+        delattr(self, name)
+        del self.attributes[attribute.id]
+        del self.attribute_names[name]
+        self.set_dirty()
+        if self.graph is not None:
+            self.graph.invalidate_schedule()
+            self.graph.notify('graph.attribute.removed', attribute)
+        return attribute
+
+    @staticmethod
+    def _items(attribute):
+        """Return the attributes of an `AttributeList`, or the attribute."""
+        if isinstance(attribute, AttributeList):
+            return list(attribute)
+        return [attribute]
+
+    def iter_attributes(self):
+        """Iterate over the attributes of this node.
+
+        Items of an `AttributeList` are yielded instead of the list.
+        """
+        for attribute in self.attributes.itervalues():
+            if isinstance(attribute, AttributeList):
+                for item in attribute:
+                    yield item
+            else:
+                yield attribute
+
+    def upstream_nodes(self):
+        """Return the nodes driving the attributes of this node.
+
+        :rtype: set(Node)
+        """
+        nodes = set()
+        for attribute in self.iter_attributes():
+            for other in attribute.inputs.itervalues():
+                nodes.add(other.node)
+        return nodes
+
+    def downstream_nodes(self):
+        """Return the nodes driven by the attributes of this node.
+
+        In a graph loaded lazily, the nodes driven are built first.
+
+        :rtype: set(Node)
+        """
+        if self.graph is not None:
+            self.graph._load_downstream(self)
+        nodes = set()
+        for attribute in self.iter_attributes():
+            for other in attribute.iter_outputs():
+                nodes.add(other.node)
+        return nodes
+
+    def set_dirty(self):
+        """Flag this node as needing to run.
+
+        :return: `False` if the node was already dirty.
+        :rtype: bool
+        """
+        if self.dirty:
+            return False
+        self.dirty = True
+        if self.graph is not None:
+            self.graph.dirty_nodes.add(self)
+        return True
+
+    def dirty_upstream(self):
+        """Return this node and the dirty nodes upstream, in evaluation order.
+
+        The upstream nodes are visited iteratively, so that long chains
+        of nodes do not hit the recursion limit.
+
+        :rtype: list(Node)
+        """
+        order = []
+        visited = set([self])
+        stack = [(self, iter(self.upstream_nodes()))]
+        while stack:
+            node, upstream = stack[-1]
+            for other in upstream:
+                if other.dirty and other not in visited:
+                    visited.add(other)
+                    stack.append((other, iter(other.upstream_nodes())))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        return order
+
+    def evaluate(self):
+        """Run this node if it is dirty.
+
+        The dirty nodes upstream are updated first.
+        """
+        if not self.dirty:
+            return
+        for node in self.dirty_upstream():
+            node.update()
+
+    def update(self):
+        """Pull, run and clean this node.
+
+        Unlike `Node.evaluate`, the upstream nodes are expected to be
+        clean already. If `Node.run` raises, the node is left dirty, to
+        run again on the next evaluation.
+        """
+        self.pull()
+        graph = self.graph
+        try:
+            if graph is None or graph.profiler is None:
+                self.run()
+            else:
+                graph.profiler.run(self)
+        except BaseException:
+            self.set_dirty()
+            raise
+        self.clean()
+
+    def pull(self):
+        """Flag this node clean and pull the values of its connected attributes.
+        """
+        self.dirty = False
+        if self.graph is not None:
+            self.graph.dirty_nodes.discard(self)
+        for attribute in self.iter_attributes():
+            if attribute.inputs:
+                attribute.value = attribute.source().value
+
+    def clean(self):
+        """Flag every attribute of this node clean."""
+        for attribute in self.iter_attributes():
+            attribute.dirty = False
 
     def run(self):
-        """Method executed when the state of the graph changes.
+        """Method executed when one of the node attributes is dirty.
+
+        Reimplement it to compute the value of the output attributes
+        from the input ones.
+        """
+
+    def compile(self):
+        """Return Python statements doing the work of `Node.run`.
+
+        Used to inline this node in a compiled region, see
+        `kukulkan.graph.compiler`. Attribute names between braces are
+        replaced by local variables holding their value, like in
+        ``{output} = {input} * 2``. `numpy` can be used.
+
+        :return: The statements, or None to have `Node.run` called.
+        :rtype: list(str)
         """
+        return None
 
 
 class Attribute(Unique):
     """A `Node` `Attribute`.
+
+    Subclasses should declare empty ``__slots__`` to keep attributes
+    compact.
+
+    References only point upstream, so that a graph holds no reference
+    cycle and is freed as soon as it is dropped: nodes own their
+    attributes, attributes own their inputs, while the node of an
+    attribute and its outputs are weak references. An attribute does
+    not keep its node alive: keep a reference to the node as long as
+    its attributes are used.
     """
 
+    __slots__ = (
+        'inputs',
+        'outputs',
+        'value',
+        '_node',
+        'name',
+        'dirty',
+        '_source',
+    )
+
     default_value = None
 
     def __init__(self, name, node):
         super(Attribute, self).__init__()
-        self.inputs = {}
-        self.outputs = {}
+        self.inputs = _NO_CONNECTIONS
+        self.outputs = _NO_CONNECTIONS
         self.value = self.default_value
         self.node = node
         self.name = name
+        self.dirty = True
+        self._source = None
 
     def __str__(self):
-        return '.'.join(map(str, [self.node, self.name]))
+        return '.'.join(map(str, [self._node() or '<freed>', self.name]))
+
+    @property
+    def node(self):
+        """Return the node of this attribute.
+
+        :rtype: Node
+        :raise ReferenceError: If the node was freed.
+        """
+        node = self._node()
+        if node is None:
+            err = 'The node of attribute {} was freed.'
+            raise ReferenceError(err.format(self.name))
+        return node
+
+    @node.setter
+    def node(self, node):
+        self._node = weakref.ref(node)
+
+    def __getstate__(self):
+        state = super(Attribute, self).__getstate__()
+        state['node'] = state.pop('_node')()
+        state['inputs'] = _NO_CONNECTIONS
+        state['outputs'] = _NO_CONNECTIONS
+        state['_source'] = None
+        return state
+
+    def attach(self, graph):
+        """Called when this attribute is added to a graph.
+
+        Reimplement it to keep the value in a graph storage.
+        """
+
+    def detach(self):
+        """Called when this attribute is removed from its graph."""
+
+    def iter_outputs(self):
+        """Iterate over the attributes this one is connected to.
+
+        Destinations that were freed without being disconnected are
+        skipped.
+        """
+        for reference in self.outputs.itervalues():
+            attribute = reference()
+            if attribute is not None:
+                yield attribute
+
+    def source(self):
+        """Return the attribute this one ultimately gets its value from.
+
+        Connections are followed upstream until an attribute without
+        input is found.
+        The result is cached on every attribute of the chain, and only
+        invalidated when a connection of that chain changes.
+
+        :rtype: Attribute
+        """
+        source = self._source
+        if source is not None:
+            return source
+        if not self.inputs:
+            return self
+        chain = []
+        source = self
+        while source.inputs and source._source is None:
+            chain.append(source)
+            source = next(source.inputs.itervalues())
+        if source._source is not None:
+            source = source._source
+        for attribute in chain:
+            attribute._source = source
+        return source
+
+    def _invalidate_sources(self):
+        """Discard the cached source of this attribute and its outputs."""
+        self._source = None
+        stack = list(self.iter_outputs())
+        while stack:
+            attribute = stack.pop()
+            if attribute._source is None:
+                continue
+            attribute._source = None
+            stack.extend(attribute.iter_outputs())
+
+    def set_dirty(self):
+        """Flag this `Attribute` and everything it affects as dirty.
+
+        Dirtiness is pushed to the connected outputs and, through the
+        attribute node, to every other attribute of that node.
+        The propagation stops on items that are already dirty, so that
+        only the affected part of the graph is visited.
+
+        During a `Graph.batch`, the propagation is deferred.
+        When the graph is profiled, this attribute is recorded as the
+        trigger of the nodes it makes dirty.
+        """
+        graph = self.node.graph
+        triggers = None
+        if graph is not None:
+            if graph._batch is not None:
+                graph._batch.dirty.append(self)
+                return
+            if graph.profiler is not None:
+                triggers = graph.profiler.triggers
+        stack = [self]
+        while stack:
+            attribute = stack.pop()
+            if attribute is None or attribute.dirty:
+                continue
+            attribute.dirty = True
+            for reference in attribute.outputs.itervalues():
+                stack.append(reference())
+            if attribute.node.set_dirty():
+                if triggers is not None:
+                    triggers[attribute.node] = self
+                stack.extend(attribute.node.iter_attributes())
 
     def validate_value(self, value):
         """Validate and possibly modify the value to set on this `Attribute`.
@@ -153,10 +985,14 @@ class Attribute(Unique):
 
     def get(self):
         """Return the value of this `Attribute`.
+
+        Connected attributes return the value of their `Attribute.source`.
+        If that source is dirty, its node is evaluated first.
         """
-        if self.inputs:
-            return self.inputs.values()[0].get()
-        return self.value
+        source = self._source or self.source()
+        if source.dirty:
+            source.node.evaluate()
+        return source.value
 
     def set(self, value):
         """Set the value of this `Attribute`.
@@ -171,17 +1007,66 @@ class Attribute(Unique):
             err = 'Attribute {} has an incoming connection, cannot be set.'
             raise AttributeError(err.format(self))
         value = self.validate_value(value)
+        graph = self.node.graph
+        if graph is not None:
+            old_value = copy.copy(self.value)
         self.value = value
+        self.set_dirty()
+        if graph is not None:
+            graph.notify('graph.attribute.changed', self, old_value)
 
     def connect(self, other):
         """Connect this `Attribute` to another one.
 
         This `Attribute` output will go in the other `Attribute` input.
+        Connecting attributes that are already connected does nothing.
 
         :param Attribute other: Attribute to connect to.
+        :raise ValueError: If the connection would create a cycle.
         """
-        self.outputs[other.uuid] = other
-        other.inputs[self.uuid] = self
+        if other.id in self.outputs:
+            return
+        graph = self.node.graph
+        linked = graph is not None and other.node in graph.order
+        if linked:
+            graph.order.add_edge(self.node, other.node)
+        elif self.node is other.node:
+            raise ValueError('{} cannot drive itself.'.format(self.node))
+        else:
+            self._check_cycle(other)
+        if self.outputs is _NO_CONNECTIONS:
+            self.outputs = {}
+        if other.inputs is _NO_CONNECTIONS:
+            other.inputs = {}
+        self.outputs[other.id] = weakref.ref(other)
+        other.inputs[self.id] = self
+        if linked:
+            graph._link(self.node, other.node)
+        other._invalidate_sources()
+        other.set_dirty()
+        for graph in self._graphs(other):
+            graph.invalidate_schedule()
+            graph.notify('graph.connection.added', self, other)
+
+    def _check_cycle(self, other):
+        """Raise if the node of another attribute drives this one.
+
+        Nodes outside of a graph have no `Graph.order` to check cycles,
+        their upstream nodes are visited instead.
+
+        :raise ValueError: If connecting the attributes creates a cycle.
+        """
+        target = other.node
+        visited = set([self.node])
+        stack = [self.node]
+        while stack:
+            for node in stack.pop().upstream_nodes():
+                if node is target:
+                    err = 'Connecting {} to {} would create a cycle.'
+                    raise ValueError(err.format(self, other))
+                if node not in visited:
+                    visited.add(node)
+                    stack.append(node)
 
     def disconnect(self, other):
         """Disconnect this `Attribute` from another one.
@@ -191,8 +1076,31 @@ class Attribute(Unique):
 
         :param Attribute other: Attribute to disconnect from.
         """
-        self.outputs.pop(other.uuid)
-        other.inputs.pop(self.uuid)
+        self.outputs.pop(other.id)
+        other.inputs.pop(self.id)
+        if not self.outputs:
+            self.outputs = _NO_CONNECTIONS
+        if not other.inputs:
+            other.inputs = _NO_CONNECTIONS
+        graph = self.node.graph
+        if graph is not None and graph is other.node.graph:
+            graph._unlink(self.node, other.node)
+        other._invalidate_sources()
+        other.set_dirty()
+        for graph in self._graphs(other):
+            graph.invalidate_schedule()
+            graph.notify('graph.connection.removed', self, other)
+
+    def _graphs(self, other):
+        """Return the graphs owning this attribute and the other one.
+
+        :rtype: tuple(Graph)
+        """
+        graph = self.node.graph
+        other_graph = other.node.graph
+        if graph is other_graph:
+            return () if graph is None else (graph,)
+        return tuple(g for g in (graph, other_graph) if g is not None)
 
 
 class AttributeList(Unique, MutableSequence):
@@ -204,12 +1112,56 @@ class AttributeList(Unique, MutableSequence):
         self.name = name
 
     def __str__(self):
-        return '.'.join([self.node, self.name])
+        return '.'.join(map(str, [self._node() or '<freed>', self.name]))
+
+    @property
+    def node(self):
+        """Return the node of this list, see `Attribute.node`.
+
+        :rtype: Node
+        :raise ReferenceError: If the node was freed.
+        """
+        node = self._node()
+        if node is None:
+            err = 'The node of attribute list {} was freed.'
+            raise ReferenceError(err.format(self.name))
+        return node
+
+    @node.setter
+    def node(self, node):
+        self._node = weakref.ref(node)
+
+    def __getstate__(self):
+        state = super(AttributeList, self).__getstate__()
+        state['node'] = state.pop('_node')()
+        return state
 
     def get(self):
         """Return the list of `Attribute` values contained."""
         return [a.get() for a in self]
 
+    def get_array(self, dtype=None):
+        """Return the values of the `Attribute` items as a single array.
+
+        The dirty nodes driving the items are evaluated once each.
+        When all the sources share a
+        `kukulkan.graph.storage.MatrixStore`, their matrices are read
+        in a single operation.
+
+        :param dtype: Type of the array items, guessed by default.
+        :rtype: numpy.ndarray
+        """
+        sources = [a._source or a.source() for a in self.attributes]
+        for node in set(s.node for s in sources if s.dirty):
+            node.evaluate()
+        store = self._store(sources)
+        if store is not None:
+            array = store.gather(sources)
+            if dtype is not None:
+                array = array.astype(dtype, copy=False)
+            return array
+        return numpy.array([s.value for s in sources], dtype=dtype)
+
     def set(self, values):
         """Set the values of the `Attribute` items contained.
 
@@ -222,10 +1174,94 @@ class AttributeList(Unique, MutableSequence):
         If there is more attributes, then the last n attributes will
         not be set.
 
-        :param list values: Values to set on the attributes.
+        Items sharing a `kukulkan.graph.storage.MatrixStore` are written
+        in a single operation, from an array with one row per item.
+        In a graph, the values are set in a `Graph.batch`, so that
+        nothing changes when one of them is invalid.
+
+        :param values: Values to set on the attributes.
+        :type values: list or numpy.ndarray
+        :raise AttributeError: If one of the items is connected.
+        """
+        if not isinstance(values, numpy.ndarray):
+            values = list(values)
+        attributes = self.attributes[:len(values)]
+        for attribute in attributes:
+            if attribute.inputs:
+                err = 'Attribute {} has an incoming connection, cannot be set.'
+                raise AttributeError(err.format(attribute))
+        graph = self.node.graph
+        if graph is None:
+            for attribute, value in zip(attributes, values):
+                attribute.value = attribute.validate_value(value)
+                attribute.set_dirty()
+            return
+        with graph.batch():
+            store = self._store(attributes)
+            if store is None:
+                for attribute, value in zip(attributes, values):
+                    attribute.set(value)
+                return
+            array = numpy.asarray(values, dtype=store.dtype)
+            array = array[:len(attributes)]
+            if array.shape[1:] != store.shape:
+                err = 'Values of shape {} cannot be set on {}.'
+                raise ValueError(err.format(array.shape, self))
+            old_values = store.gather(attributes)
+            store.scatter(attributes, array)
+            for attribute, old_value in zip(attributes, old_values):
+                graph.notify('graph.attribute.changed', attribute, old_value)
+
+    @staticmethod
+    def _store(attributes):
+        """Return the store shared by attributes of a single type.
+
+        :rtype: kukulkan.graph.storage.MatrixStore or None
+        """
+        if not attributes:
+            return None
+        cls = type(attributes[0])
+        store = getattr(attributes[0], 'store', None)
+        if store is None:
+            return None
+        for attribute in attributes:
+            if type(attribute) is not cls or attribute.store is not store:
+                return None
+        return store
+
+    def connect(self, other):
+        """Connect the items of this list to the items of another one.
+
+        Each item drives the item of the other list at the same index.
+        In a graph, the connections are made in a single `Graph.batch`.
+
+        :param AttributeList other: List to connect to.
+        :raise ValueError: If the lists do not have the same length, or
+                           if a connection would create a cycle.
+        """
+        self._pairwise(other, Attribute.connect)
+
+    def disconnect(self, other):
+        """Disconnect the items of this list from the items of another one.
+
+        :param AttributeList other: List to disconnect from.
+        :raise ValueError: If the lists do not have the same length.
         """
-        for attribute, value in zip(self, values):
-            attribute.set(value)
+        self._pairwise(other, Attribute.disconnect)
+
+    def _pairwise(self, other, method):
+        """Call an `Attribute` method on the items of both lists."""
+        if len(self) != len(other):
+            err = 'Cannot pair the {} items of {} with the {} items of {}.'
+            raise ValueError(err.format(len(self), self, len(other), other))
+        graph = self.node.graph or other.node.graph
+        if graph is None:
+            for source, destination in zip(self, other):
+                method(source, destination)
+            return
+        with graph.batch():
+            for source, destination in zip(self, other):
+                method(source, destination)
 
     # MutableSequence implementation
     # ------------------------------
@@ -233,14 +1269,69 @@ class AttributeList(Unique, MutableSequence):
         return self.attributes[index]
 
     def __setitem__(self, index, value):
-        self.attributes[index] = value
+        if not isinstance(index, slice):
+            index = self._index(index)
+            del self[index]
+            self.insert(index, value)
+            return
+        indices = range(*index.indices(len(self)))
+        values = list(value)
+        if index.step not in (None, 1):
+            if len(values) != len(indices):
+                err = 'Cannot assign {} items to an extended slice of {}.'
+                raise ValueError(err.format(len(values), len(indices)))
+            for position, item in zip(indices, values):
+                self[position] = item
+            return
+        del self[index]
+        start = index.indices(len(self))[0]
+        for offset, item in enumerate(values):
+            self.insert(start + offset, item)
 
     def __delitem__(self, index):
+        if isinstance(index, slice):
+            for position in reversed(range(*index.indices(len(self)))):
+                del self[position]
+            return
+        index = self._index(index)
+        item = self.attributes[index]
+        for other in item.inputs.values():
+            other.disconnect(item)
+        for other in list(item.iter_outputs()):
+            item.disconnect(other)
         del self.attributes[index]
+        item.detach()
+        self._changed('graph.item.removed', index, item)
 
     def __len__(self):
         return len(self.attributes)
 
+    def _index(self, index):
+        """Return a positive index of an item.
+
+        :raise IndexError: If there is no item at the index.
+        """
+        if index < 0:
+            index += len(self.attributes)
+        if not 0 <= index < len(self.attributes):
+            raise IndexError('{} has no item {}.'.format(self, index))
+        return index
+
     def insert(self, index, value):
         """Insert a new attribute at the given index."""
-        return self.attributes.insert(index, value)
+        count = len(self.attributes)
+        if index < 0:
+            index = max(index + count, 0)
+        index = min(index, count)
+        self.attributes.insert(index, value)
+        if self.node.graph is not None:
+            value.attach(self.node.graph)
+        self._changed('graph.item.inserted', index, value)
+
+    def _changed(self, name, index, item):
+        """Flag the node dirty and notify an item inserted or removed."""
+        node = self.node
+        node.set_dirty()
+        if node.graph is not None:
+            node.graph.invalidate_schedule()
+            node.graph.notify(name, self, index, item)
@@ -1,44 +1,133 @@
+import numpy
+
 from kukulkan.graph.api import Attribute
 
 
+_value = Attribute.value
+
+
 class Matrix(Attribute):
-    """A matrix attribute."""
+    """A matrix attribute, stored as a `numpy.ndarray`.
+
+    When its node is part of a `Graph`, a matrix with a `dtype` is kept
+    in the graph `kukulkan.graph.storage.MatrixStore` for its class, and
+    `Matrix.value` is a read-only view of its row: the store is written
+    through `Matrix.set`, or `kukulkan.graph.storage.MatrixStore.scatter`
+    for many matrices at once.
+    """
+
+    __slots__ = ('store', 'index')
 
     shape = (4, 4)
+    dtype = None
+
+    def __init__(self, name, node):
+        self.store = None
+        self.index = None
+        super(Matrix, self).__init__(name, node)
+
+    def __getstate__(self):
+        state = super(Matrix, self).__getstate__()
+        state['store'] = None
+        state['index'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.store = None
+        super(Matrix, self).__setstate__(state)
+
+    @property
+    def value(self):
+        """Return the raw value of this matrix.
+
+        Matrices kept in a store return a read-only view of their row.
+        """
+        if self.store is None:
+            return _value.__get__(self)
+        view = self.store.array[self.index]
+        view.flags.writeable = False
+        return view
+
+    @value.setter
+    def value(self, value):
+        if self.store is None:
+            _value.__set__(self, value)
+        else:
+            self.store.array[self.index] = value
+
+    def bind(self, store, index):
+        """Use an existing row of a store as the value of this matrix.
+
+        :param kukulkan.graph.storage.MatrixStore store: Store to use.
+        :param int index: Row of the store.
+        """
+        self.detach()
+        self.store = store
+        self.index = index
+        _value.__set__(self, None)
+
+    def attach(self, graph):
+        """Move the value of this matrix in the graph store."""
+        if self.dtype is None or self.store is not None:
+            return
+        value = _value.__get__(self)
+        if value is None:
+            return
+        store = graph.store(type(self))
+        self.index = store.allocate(value)
+        self.store = store
+        _value.__set__(self, None)
+
+    def detach(self):
+        """Move the value of this matrix out of its graph store."""
+        if self.store is None:
+            return
+        value = self.store.array[self.index].copy()
+        self.store.release(self.index)
+        self.store = None
+        self.index = None
+        _value.__set__(self, value)
 
     def validate_value(self, value):
-        """Validate the shape of the specified matrix.
+        """Convert the specified matrix to an array and check its shape.
 
-        :rtype: tuple(tuple)
+        Arrays already of the right type and shape are used as is,
+        without any copy.
+
+        :rtype: numpy.ndarray
         """
+        if (
+            type(value) is numpy.ndarray
+            and value.shape == self.shape
+            and value.dtype == self.dtype
+        ):
+            return value
         err = '{v} cannot be converted to a {s} matrix !'
-        if len(value) != self.shape[0]:
+        try:
+            array = numpy.asarray(value, dtype=self.dtype)
+        except (TypeError, ValueError):
+            raise ValueError(err.format(v=value, s=self.shape))
+        if array.shape != self.shape:
             raise ValueError(err.format(v=value, s=self.shape))
-        for item in value:
-            if len(item) != self.shape[1]:
-                raise ValueError(err.format(v=value, s=self.shape))
-        return value
+        return array
 
 
 class TypedMatrix(Matrix):
-    """A Matrix with a predefined type of items."""
+    """A Matrix with a predefined type of items.
 
-    def validate_item(self, item):
-        """Implement that one to customize the items type.
-        """
-        raise NotImplementedError()
+    Subclasses set the `dtype` items are converted to. The former
+    ``validate_item`` method is not called anymore: reimplement
+    `Matrix.validate_value` to convert values further.
+    """
 
-    def validate_value(self, value):
-        """Make sure the content of the matrix fits the item type."""
-        value = super(TypedMatrix, self).validate_value(value)
-        for i, row in enumerate(value):
-            value[i] = map(self.validate_item, row)
-        return value
+    __slots__ = ()
 
 
 class XForm(TypedMatrix):
-    """A 4 by 4 float `TypedMatrix`."""
+    """A 4 by 4 float `TypedMatrix`, identity by default."""
+
+    __slots__ = ()
 
-    def validate_item(self, item):
-        """Make sure we use `float` items."""
-        return float(item)
+    dtype = numpy.float64
+    default_value = numpy.identity(4)
+    default_value.flags.writeable = False
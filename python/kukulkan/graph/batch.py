@@ -0,0 +1,68 @@
+"""Deferred propagation of graph changes."""
+
+
+class Batch(object):
+    """Changes made on a `Graph` during a transaction.
+
+    Dirty propagation and event notifications are stored until the
+    batch is committed, so that they are applied once for all the
+    changes.
+    The stored events are also used to undo the changes when the batch
+    is rolled back.
+    """
+
+    def __init__(self):
+        self.dirty = []
+        self.events = []
+
+    def commit(self, graph):
+        """Propagate dirtiness and send the stored notifications.
+
+        Successive value changes of an attribute are merged in a single
+        notification carrying the value it had before the batch.
+        """
+        for attribute in self.dirty:
+            attribute.set_dirty()
+        changed = set()
+        for name, args in self.events:
+            if name == 'graph.attribute.changed':
+                if args[0] in changed:
+                    continue
+                changed.add(args[0])
+            graph.publish(name, *args)
+
+    def rollback(self, graph):
+        """Undo the changes of this batch, latest first."""
+        for name, args in reversed(self.events):
+            undo(graph, name, *args)
+
+
+def undo(graph, name, *args):
+    """Revert a graph change described by an event.
+
+    :param Graph graph: Graph the change happened in.
+    :param str name: Name of the event.
+    :param args: Arguments of the event, without the graph.
+    """
+    if name == 'graph.node.added':
+        graph.remove_node(args[0])
+    elif name == 'graph.node.removed':
+        graph.add_node(args[0])
+    elif name == 'graph.attribute.added':
+        args[0].node.remove_attribute(args[0].name)
+    elif name == 'graph.attribute.removed':
+        args[0].node._insert_attribute(args[0])
+    elif name == 'graph.connection.added':
+        args[0].disconnect(args[1])
+    elif name == 'graph.connection.removed':
+        args[0].connect(args[1])
+    elif name == 'graph.node.renamed':
+        args[0].name = args[1]
+    elif name == 'graph.item.inserted':
+        del args[0][args[1]]
+    elif name == 'graph.item.removed':
+        args[0].insert(args[1], args[2])
+    elif name == 'graph.attribute.changed':
+        attribute, value = args
+        attribute.value = value
+        attribute.set_dirty()
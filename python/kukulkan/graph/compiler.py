@@ -0,0 +1,217 @@
+"""Compilation of graph regions to Python functions.
+
+A region is a set of nodes evaluated together. Compiling it generates
+the source of a single function running its nodes in evaluation order,
+where every node, attribute and value is a local variable:
+
+    * Connected attributes get the value of their source from a local
+      variable, instead of resolving the source and looking it up.
+    * Nodes returning statements from `kukulkan.graph.api.Node.compile`
+      are inlined, the others get their bound ``run`` method called.
+    * Dirty flags are reset in place, without iterating attributes.
+
+A region is compiled again the first time it is evaluated after the
+topology of its graph changed.
+"""
+import string
+import time
+import weakref
+
+import numpy
+
+
+_FORMATTER = string.Formatter()
+
+
+class Region(object):
+    """Nodes of a graph evaluated by a generated function.
+
+    Every node of the region runs on each evaluation, whether it is
+    dirty or not. Dirty nodes driving the region from outside are
+    evaluated first.
+
+    :param kukulkan.graph.api.Graph graph: Graph owning the nodes.
+    :param nodes: Nodes of the region, all the nodes of the graph by
+                  default.
+    """
+
+    def __init__(self, graph, nodes=None):
+        self._graph = weakref.ref(graph)
+        self.members = None if nodes is None else list(nodes)
+        self.topology = None
+        self.nodes = []
+        self.external = []
+        self.source = None
+        self._function = None
+        self._objects = []
+
+    def __str__(self):
+        return 'region of {} nodes'.format(len(self.nodes))
+
+    @property
+    def graph(self):
+        """Return the graph of the region, or None if it was freed.
+
+        Graphs cache their regions, so they are only weakly referenced.
+
+        :rtype: kukulkan.graph.api.Graph
+        """
+        return self._graph()
+
+    def compile(self):
+        """Generate the function evaluating the nodes of the region."""
+        graph = self.graph
+        if self.members is None:
+            nodes = graph.nodes.values()
+        else:
+            nodes = [n for n in self.members if n.graph is graph]
+        self.nodes = graph.order.sort(nodes)
+        generator = _Generator(self.nodes)
+        self.source = generator.source()
+        self.external = list(generator.external)
+        self._objects = generator.objects
+        namespace = {'numpy': numpy}
+        code = compile(self.source, '<compiled region>', 'exec')
+        exec code in namespace
+        # Popped, so that the function and its globals are not a cycle.
+        self._function = namespace.pop('evaluate')
+        self.topology = graph.topology
+
+    def release(self):
+        """Drop the generated function and the objects it references.
+
+        The region is compiled again when evaluated next.
+        """
+        self.topology = None
+        self.nodes = []
+        self.external = []
+        self.source = None
+        self._function = None
+        self._objects = []
+
+    def evaluate(self):
+        """Run every node of the region.
+
+        With a profiler set on the graph, the region is recorded as a
+        single run.
+        """
+        graph = self.graph
+        if self.topology != graph.topology:
+            self.compile()
+        for node in self.external:
+            if node.dirty:
+                node.evaluate()
+        profiler = graph.profiler
+        if profiler is None:
+            self._function(self._objects)
+        else:
+            start = time.time()
+            try:
+                self._function(self._objects)
+            finally:
+                duration = time.time() - start
+                profiler.record(self, start, duration, self.nodes)
+        graph.dirty_nodes.difference_update(self.nodes)
+
+
+class _Generator(object):
+    """Source of the function evaluating a list of sorted nodes."""
+
+    def __init__(self, nodes):
+        self.region = set(nodes)
+        self.objects = []
+        self.names = {}
+        self.values = {}
+        self.external = set()
+        self.lines = []
+        self._count = 0
+        self.used = set(
+            attribute.source()
+            for node in nodes
+            for attribute in node.iter_attributes()
+            if attribute.inputs
+        )
+        for node in nodes:
+            self.node(node)
+
+    def source(self):
+        """Return the source of the function."""
+        lines = ['def evaluate(objects):']
+        if self.objects:
+            lines.append('    [{}] = objects'.format(', '.join(
+                self.names[id(o)] for o in self.objects
+            )))
+        lines.extend('    ' + line for line in self.lines or ['pass'])
+        return '\n'.join(lines) + '\n'
+
+    def ref(self, obj):
+        """Return the local variable holding an object."""
+        name = self.names.get(id(obj))
+        if name is None:
+            name = self.names[id(obj)] = 'o{}'.format(len(self.objects))
+            self.objects.append(obj)
+        return name
+
+    def local(self):
+        """Return a new local variable for a value."""
+        self._count += 1
+        return 'v{}'.format(self._count)
+
+    def value(self, source):
+        """Return the local variable holding the value of a source."""
+        local = self.values.get(source)
+        if local is None:
+            if source.node not in self.region:
+                self.external.add(source.node)
+            local = self.values[source] = self.local()
+            self.lines.append('{} = {}.value'.format(local, self.ref(source)))
+        return local
+
+    def node(self, node):
+        """Add the evaluation of a node."""
+        lines = self.lines
+        lines.append('{}.dirty = False'.format(self.ref(node)))
+        pulled = [
+            (attribute, self.value(attribute.source()))
+            for attribute in node.iter_attributes()
+            if attribute.inputs
+        ]
+        statements = node.compile()
+        if statements is None:
+            for attribute, local in pulled:
+                lines.append('{}.value = {}'.format(self.ref(attribute), local))
+            lines.append('{}()'.format(self.ref(node.run)))
+            for attribute in node.iter_attributes():
+                if attribute in self.used:
+                    local = self.values[attribute] = self.local()
+                    lines.append(
+                        '{} = {}.value'.format(local, self.ref(attribute))
+                    )
+        else:
+            self.inline(node, statements, pulled)
+        for attribute in node.iter_attributes():
+            lines.append('{}.dirty = False'.format(self.ref(attribute)))
+
+    def inline(self, node, statements, pulled):
+        """Add the statements of a node, working on local variables."""
+        lines = self.lines
+        mapping = {}
+        for attribute, local in pulled:
+            if node.attribute_names.get(attribute.name) is attribute:
+                mapping[attribute.name] = local
+            lines.append('{}.value = {}'.format(self.ref(attribute), local))
+        for statement in statements:
+            for _, field, _, _ in _FORMATTER.parse(statement):
+                if field is None or field in mapping:
+                    continue
+                attribute = node.attribute_names[field]
+                local = mapping[field] = self.local()
+                lines.append('{} = {}.value'.format(local, self.ref(attribute)))
+        lines.extend(s.format(**mapping) for s in statements)
+        for name, local in mapping.iteritems():
+            attribute = node.attribute_names[name]
+            if attribute.inputs:
+                continue
+            lines.append('{}.value = {}'.format(self.ref(attribute), local))
+            if attribute in self.used:
+                self.values[attribute] = local
@@ -0,0 +1,169 @@
+"""Evaluation of a graph over a range of frames.
+
+Input attributes are given one value per frame, stacked in an array
+whose first axis is time. Each node driven by these inputs runs once
+for the whole range:
+
+    * Nodes with `kukulkan.graph.api.Node.batched` set run once, on
+      values carrying the time axis. Their ``run`` must only use
+      operations broadcasting over it, like `numpy.matmul`.
+    * Other nodes run once per frame, on the value of each frame.
+
+The values of the graph are restored afterwards, and the nodes that
+ran are left dirty: the next evaluation runs them on the restored
+values, reverting what they did outside of their attributes, like
+setting the local matrices of a `kukulkan.graph.hierarchy.Hierarchy`.
+"""
+import copy
+
+import numpy
+
+
+def evaluate_frames(graph, inputs, outputs):
+    """Evaluate a graph for every frame of the specified inputs.
+
+    :param kukulkan.graph.api.Graph graph: Graph to evaluate.
+    :param dict inputs: Values of unconnected attributes, by attribute,
+                        as arrays with one item per frame.
+    :param list outputs: Attributes to return the values of.
+    :return: Values of the outputs, by attribute, as arrays with one
+             item per frame.
+    :rtype: dict
+    :raise ValueError: If the inputs do not have the same frame count or
+                       an input is connected.
+    """
+    inputs = dict((a, numpy.asarray(v)) for a, v in inputs.iteritems())
+    counts = set(len(v) for v in inputs.itervalues())
+    if len(counts) != 1:
+        raise ValueError('Inputs must have the same number of frames.')
+    frames = counts.pop()
+    for attribute in inputs:
+        if attribute.inputs:
+            err = 'Attribute {} has an incoming connection, cannot be set.'
+            raise ValueError(err.format(attribute))
+
+    graph.evaluate()
+    nodes = _downstream(graph, set(a.node for a in inputs))
+    attributes = [a for n in nodes for a in n.iter_attributes()]
+    saved = [(a, a.value) for a in attributes]
+    bindings = _unbind(attributes)
+    try:
+        timed = set(inputs)
+        for attribute, value in inputs.iteritems():
+            attribute.value = value
+        for node in nodes:
+            if node.batched:
+                _run_batched(node, timed)
+            else:
+                _run_frames(node, timed, frames)
+        results = {}
+        for attribute in outputs:
+            value = attribute.get()
+            if attribute.source() not in timed:
+                value = numpy.repeat(
+                    numpy.asarray(value)[numpy.newaxis],
+                    frames,
+                    axis=0,
+                )
+            results[attribute] = value
+    finally:
+        for attribute, value in saved:
+            attribute.value = value
+        _rebind(bindings)
+        for node in nodes:
+            node.set_dirty()
+    return results
+
+
+def _downstream(graph, nodes):
+    """Return the nodes driven by the specified ones, in evaluation order.
+
+    :rtype: list
+    """
+    found = set(nodes)
+    stack = list(nodes)
+    while stack:
+        for other in graph.downstream(stack.pop()):
+            if other not in found:
+                found.add(other)
+                stack.append(other)
+    return graph.order.sort(found)
+
+
+def _unbind(attributes):
+    """Take matrices out of their store, so that they can hold frames.
+
+    The rows of the store are left untouched.
+
+    :return: The store and row of each matrix unbound.
+    :rtype: list
+    """
+    bindings = []
+    for attribute in attributes:
+        store = getattr(attribute, 'store', None)
+        if store is None:
+            continue
+        bindings.append((attribute, store, attribute.index))
+        value = attribute.value.copy()
+        attribute.store = None
+        attribute.value = value
+    return bindings
+
+
+def _rebind(bindings):
+    """Put matrices back in their store, at their previous row."""
+    for attribute, store, index in bindings:
+        attribute.value = None
+        attribute.store = store
+        attribute.index = index
+
+
+def _timed_inputs(node, timed):
+    """Return the attributes of a node holding or driven by timed values.
+    """
+    return [a for a in node.iter_attributes() if a.source() in timed]
+
+
+def _run_batched(node, timed):
+    """Run a node once on values carrying the time axis."""
+    attributes = list(node.iter_attributes())
+    before = [a.value for a in attributes]
+    node.pull()
+    node.run()
+    for attribute, value in zip(attributes, before):
+        if not attribute.inputs and attribute.value is not value:
+            timed.add(attribute)
+
+
+def _run_frames(node, timed, frames):
+    """Run a node once per frame, then stack the values it wrote.
+
+    Connected attributes read the value of their source, so the timed
+    sources hold the value of the current frame while the node runs.
+    """
+    attributes = list(node.iter_attributes())
+    inputs = _timed_inputs(node, timed)
+    sources = dict((a.source(), a.source().value) for a in inputs)
+    node.pull()
+    outputs = [a for a in attributes if a not in inputs and not a.inputs]
+    before = [a.value for a in outputs]
+    values = [[] for _ in outputs]
+    written = set()
+    try:
+        for frame in xrange(frames):
+            for source, value in sources.iteritems():
+                source.value = value[frame]
+            node.run()
+            for attribute, value, items in zip(outputs, before, values):
+                if attribute.value is not value:
+                    written.add(attribute)
+                items.append(copy.copy(attribute.value))
+    finally:
+        for source, value in sources.iteritems():
+            source.value = value
+    for attribute, value, items in zip(outputs, before, values):
+        if attribute in written:
+            attribute.value = numpy.array(items)
+            timed.add(attribute)
+        else:
+            attribute.value = value
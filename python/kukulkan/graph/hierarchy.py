@@ -0,0 +1,144 @@
+"""Vectorized world matrices computation for `Transform` hierarchies."""
+import numpy
+
+
+class Hierarchy(object):
+    """Compute the world matrices of a set of transforms in batch.
+
+    Transforms are stored depth-first, so that every subtree is a
+    contiguous range of indices, and grouped by depth.
+    World matrices are then solved one depth level at a time, with a
+    single `numpy.matmul` per level.
+
+    Each transform is linked to this hierarchy: running a transform
+    copies its local ``xform`` here and flags its subtree dirty, so
+    that `Hierarchy.solve` only updates the dirty subtrees. Transforms
+    own their hierarchy, which only knows them by id.
+
+    Reparenting one of the transforms invalidates the hierarchy, which
+    cannot be solved anymore: build a new one from the transforms.
+
+    :param transforms: Transforms to solve. Transforms whose parent is
+                       not part of them are considered roots.
+    :type transforms: list(kukulkan.graph.nodes.transform.Transform)
+    """
+
+    def __init__(self, transforms):
+        members = set(transforms)
+        roots = [t for t in transforms if t.parent not in members]
+        ordered = []
+        parents = []
+        depths = []
+        ends = []
+        stack = [(root, -1, 0) for root in reversed(roots)]
+        while stack:
+            transform, parent, depth = stack.pop()
+            index = len(ordered)
+            ordered.append(transform)
+            parents.append(parent)
+            depths.append(depth)
+            ends.append(None)
+            children = [c for c in transform.children if c in members]
+            for child in reversed(children):
+                stack.append((child, index, depth + 1))
+        self.indices = dict((t.id, i) for i, t in enumerate(ordered))
+        self.parents = numpy.array(parents, dtype=numpy.intp)
+        self.depths = numpy.array(depths, dtype=numpy.intp)
+        self.ends = self._subtree_ends()
+        count = len(ordered)
+        self.levels = [
+            numpy.flatnonzero(self.depths == depth)
+            for depth in xrange(self.depths.max() + 1 if count else 0)
+        ]
+        self.locals = numpy.empty((count, 4, 4))
+        self.locals[:] = numpy.identity(4)
+        self.worlds = numpy.empty((count, 4, 4))
+        self.dirty = numpy.ones(count, dtype=bool)
+        self.valid = True
+        for index, transform in enumerate(ordered):
+            transform.hierarchy = self
+            value = transform.xform.get()
+            if value is not None:
+                self.locals[index] = value
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _subtree_ends(self):
+        """Return the index following the last descendant of each item."""
+        count = len(self.parents)
+        ends = numpy.arange(1, count + 1, dtype=numpy.intp)
+        for index in xrange(count - 1, 0, -1):
+            parent = self.parents[index]
+            if parent >= 0 and ends[index] > ends[parent]:
+                ends[parent] = ends[index]
+        return ends
+
+    def mark_dirty(self, indices):
+        """Flag the subtrees starting at the specified indices dirty.
+
+        :param indices: Indices of the subtree roots.
+        :type indices: numpy.ndarray or list(int)
+        """
+        indices = numpy.asarray(indices, dtype=numpy.intp)
+        steps = numpy.zeros(len(self.indices) + 1, dtype=numpy.intp)
+        numpy.add.at(steps, indices, 1)
+        numpy.add.at(steps, self.ends[indices], -1)
+        self.dirty |= numpy.cumsum(steps[:-1]) > 0
+
+    def set_local(self, transform, matrix):
+        """Set the local matrix of a transform and flag its subtree dirty.
+
+        :param transform: Transform to update.
+        :param matrix: Its new local matrix, `None` for identity.
+        """
+        index = self.indices[transform.id]
+        if matrix is None:
+            matrix = numpy.identity(4)
+        self.locals[index] = matrix
+        self.dirty[index:self.ends[index]] = True
+
+    def set_locals(self, indices, matrices):
+        """Set several local matrices at once.
+
+        :param indices: Indices of the transforms to update.
+        :param numpy.ndarray matrices: A (n, 4, 4) array of matrices.
+        """
+        indices = numpy.asarray(indices, dtype=numpy.intp)
+        self.locals[indices] = matrices
+        self.mark_dirty(indices)
+
+    def invalidate(self):
+        """Flag this hierarchy as no longer matching its transforms."""
+        self.valid = False
+
+    def solve(self):
+        """Update the world matrices of the dirty subtrees.
+
+        :raise ValueError: If the hierarchy was invalidated.
+        """
+        if not self.valid:
+            err = 'Transforms were reparented, rebuild the hierarchy.'
+            raise ValueError(err)
+        dirty = self.dirty
+        for depth, level in enumerate(self.levels):
+            indices = level[dirty[level]]
+            if not len(indices):
+                continue
+            if depth == 0:
+                self.worlds[indices] = self.locals[indices]
+            else:
+                parents = self.worlds[self.parents[indices]]
+                numpy.matmul(parents, self.locals[indices], out=parents)
+                self.worlds[indices] = parents
+        dirty[:] = False
+
+    def world(self, transform):
+        """Return the world matrix of a transform, solving if needed.
+
+        :rtype: numpy.ndarray
+        :raise ValueError: If the hierarchy was invalidated.
+        """
+        if self.dirty.any() or not self.valid:
+            self.solve()
+        return self.worlds[self.indices[transform.id]]
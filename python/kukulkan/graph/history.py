@@ -0,0 +1,246 @@
+"""Undo and redo of graph changes.
+
+A `History` records the changes notified by a graph. Taking a snapshot
+closes the current `Step`, which only holds the changes made since the
+previous snapshot: the state they did not touch is shared with the
+graph itself. Taking a snapshot and moving to another one therefore
+cost as much as the changes in between, whatever the size of the graph.
+
+    history = History(graph)
+    node.xform.set(pose)
+    history.snapshot('Pose')
+    history.undo()
+    history.redo()
+"""
+import collections
+import copy
+import sys
+import weakref
+
+import numpy
+
+import kukulkan.graph.api
+import kukulkan.graph.batch
+
+
+# Estimated size of a recorded event, without its values.
+_EVENT_SIZE = 128
+
+
+def _size(value):
+    """Return the estimated memory size of a recorded value, in bytes."""
+    if isinstance(value, numpy.ndarray):
+        return value.nbytes + _EVENT_SIZE
+    return sys.getsizeof(value)
+
+
+def _event_size(name, args):
+    """Return the estimated memory size of a recorded event, in bytes.
+
+    Removed nodes, attributes and items are kept with their values, to
+    restore them.
+    """
+    size = _EVENT_SIZE + sum(_size(a) for a in args[1:])
+    if name == 'graph.node.removed':
+        attributes = args[0].iter_attributes()
+    elif name == 'graph.attribute.removed':
+        attributes = args[0]
+        if not isinstance(attributes, kukulkan.graph.api.AttributeList):
+            attributes = [attributes]
+    elif name == 'graph.item.removed':
+        attributes = [args[2]]
+    else:
+        return size
+    return size + sum(_size(a.value) for a in attributes)
+
+
+class Step(object):
+    """Changes made on a graph between two snapshots.
+
+    Successive value changes of an attribute are merged, keeping the
+    value before the first change and the value after the last one.
+
+    :param str label: Description of the changes.
+    :param list events: Events notified by the graph, as name and
+                        arguments.
+    """
+
+    def __init__(self, label, events):
+        self.label = label
+        self.events = []
+        changed = {}
+        for name, args in events:
+            if name == 'graph.attribute.changed':
+                if args[0] in changed:
+                    continue
+                changed[args[0]] = len(self.events)
+            self.events.append((name, args))
+        # State reached at the end of the step, used to redo it.
+        self.values = {}
+        for attribute in changed:
+            self.values[attribute] = copy.copy(attribute.value)
+        self.names = {}
+        for name, args in self.events:
+            if name == 'graph.node.renamed':
+                self.names[args[0]] = args[0].name
+        self.size = sum(_event_size(n, a) for n, a in self.events)
+        self.size += sum(_size(v) for v in self.values.itervalues())
+
+    def __len__(self):
+        return len(self.events)
+
+    def undo(self, graph):
+        """Revert the changes of this step, latest first."""
+        for name, args in reversed(self.events):
+            if name == 'graph.attribute.changed':
+                _set_value(graph, args[0], args[1])
+            else:
+                kukulkan.graph.batch.undo(graph, name, *args)
+
+    def redo(self, graph):
+        """Apply the changes of this step again."""
+        for name, args in self.events:
+            if name == 'graph.node.added':
+                graph.add_node(args[0])
+            elif name == 'graph.node.removed':
+                graph.remove_node(args[0])
+            elif name == 'graph.node.renamed':
+                args[0].name = self.names[args[0]]
+            elif name == 'graph.attribute.added':
+                args[0].node._insert_attribute(args[0])
+            elif name == 'graph.attribute.removed':
+                args[0].node.remove_attribute(args[0].name)
+            elif name == 'graph.connection.added':
+                args[0].connect(args[1])
+            elif name == 'graph.connection.removed':
+                args[0].disconnect(args[1])
+            elif name == 'graph.item.inserted':
+                args[0].insert(args[1], args[2])
+            elif name == 'graph.item.removed':
+                del args[0][args[1]]
+            elif name == 'graph.attribute.changed':
+                _set_value(graph, args[0], self.values[args[0]])
+
+
+def _set_value(graph, attribute, value):
+    """Restore the value of an attribute, notifying the change."""
+    old_value = copy.copy(attribute.value)
+    attribute.value = value
+    attribute.set_dirty()
+    graph.notify('graph.attribute.changed', attribute, old_value)
+
+
+class History(object):
+    """Snapshots of a graph, to undo and redo its changes.
+
+    When the recorded steps use more memory than the budget, the oldest
+    ones are forgotten. Sizes are estimated from the values kept to
+    restore the changes.
+
+    :param kukulkan.graph.api.Graph graph: Graph to follow.
+    :param int budget: Maximum memory used by the steps, in bytes.
+    """
+
+    def __init__(self, graph, budget=64 * 1024 * 1024):
+        self._graph = weakref.ref(graph)
+        self.budget = budget
+        self.pending = []
+        self.undo_steps = collections.deque()
+        self.redo_steps = []
+        self.size = 0
+        self._restoring = False
+        graph.listeners.append(self.record)
+
+    @property
+    def graph(self):
+        """Return the graph followed, or None if it was freed.
+
+        The graph owns its listeners, so it is only weakly referenced.
+
+        :rtype: kukulkan.graph.api.Graph
+        """
+        return self._graph()
+
+    def close(self):
+        """Stop following the changes of the graph."""
+        self.graph.listeners.remove(self.record)
+
+    def record(self, name, *args):
+        """Record a change notified by the graph."""
+        if self._restoring:
+            return
+        self.pending.append((name, args))
+        if self.redo_steps:
+            self.size -= sum(s.size for s in self.redo_steps)
+            del self.redo_steps[:]
+
+    def snapshot(self, label=''):
+        """Close the current step.
+
+        Nothing is recorded if the graph did not change.
+
+        :param str label: Description of the changes of the step.
+        :return: The step closed, or None.
+        :rtype: Step
+        """
+        if not self.pending:
+            return None
+        step = Step(label, self.pending)
+        self.pending = []
+        self.undo_steps.append(step)
+        self.size += step.size
+        while self.size > self.budget and len(self.undo_steps) > 1:
+            self.size -= self.undo_steps.popleft().size
+        return step
+
+    def undo(self):
+        """Revert the last step, closing the current one first.
+
+        :return: The step reverted, or None if there is nothing to undo.
+        :rtype: Step
+        """
+        self.snapshot()
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self._restore(step.undo)
+        self.redo_steps.append(step)
+        return step
+
+    def redo(self):
+        """Apply the last reverted step again.
+
+        :return: The step applied, or None if there is nothing to redo.
+        :rtype: Step
+        """
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self._restore(step.redo)
+        self.undo_steps.append(step)
+        return step
+
+    def restore(self, step):
+        """Undo or redo steps until the specified one is the last applied.
+
+        :param Step step: Step to go back or forward to.
+        :raise ValueError: If the step is not in the history.
+        """
+        self.snapshot()
+        if step in self.undo_steps:
+            while self.undo_steps[-1] is not step:
+                self.undo()
+        elif step in self.redo_steps:
+            while not self.undo_steps or self.undo_steps[-1] is not step:
+                self.redo()
+        else:
+            raise ValueError('{} is not in the history.'.format(step))
+
+    def _restore(self, apply):
+        """Apply a step in a batch, without recording its changes."""
+        self._restoring = True
+        try:
+            with self.graph.batch():
+                apply(self.graph)
+        finally:
+            self._restoring = False
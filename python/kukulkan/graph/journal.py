@@ -0,0 +1,405 @@
+"""Changes made on a graph since it was last saved.
+
+A `Journal` follows the notifications of a graph and keeps the net
+changes made on it: nodes, attributes and connections added or removed,
+and attributes whose value changed. These changes are written as small
+JSON patches, applied in order on top of a full save:
+
+    journal = Journal(graph)
+    ...
+    journal.save_patch('rig.0001.patch')
+    ...
+    journal.compact('rig.kukg')
+
+Nodes are identified by their uuid and attributes by their name, so
+that patches apply on a graph loaded from the base file.
+"""
+import json
+import uuid
+import weakref
+
+import numpy
+
+import kukulkan.graph.api
+import kukulkan.graph.serialization
+
+
+PATCH_VERSION = 2
+
+
+def attribute_path(attribute):
+    """Return the path identifying an attribute in a patch.
+
+    Items of an `kukulkan.graph.api.AttributeList` are identified by
+    the name of the list and their index.
+
+    :rtype: list
+    """
+    node = attribute.node
+    path = [node.uuid.hex, attribute.name]
+    if node.attribute_names.get(attribute.name) is attribute:
+        return path
+    for parent in node.attributes.itervalues():
+        if isinstance(parent, kukulkan.graph.api.AttributeList):
+            if attribute in parent.attributes:
+                return [path[0], parent.name, parent.index(attribute)]
+    err = 'Attribute {} does not belong to its node.'.format(attribute.name)
+    raise KeyError(err)
+
+
+def find_attribute(nodes, path):
+    """Return the attribute at a path made by `attribute_path`.
+
+    :param dict nodes: Nodes by uuid hex.
+    :param list path: Path of the attribute.
+    :rtype: kukulkan.graph.api.Attribute
+    """
+    attribute = nodes[path[0]].attribute_names[path[1]]
+    if len(path) > 2:
+        attribute = attribute[path[2]]
+    return attribute
+
+
+def _encode(value):
+    """Return a value that can be written as JSON."""
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    return value
+
+
+class Journal(object):
+    """Net changes of a graph since the last save.
+
+    Changes that cancel each other are forgotten: a node added then
+    removed does not appear in the next patch.
+    Changes made while the graph is muted, like nodes built by a lazy
+    load, are not changes of the graph and are not recorded.
+
+    :param kukulkan.graph.api.Graph graph: Graph to follow.
+    """
+
+    def __init__(self, graph):
+        self._graph = weakref.ref(graph)
+        self.clear()
+        graph.listeners.append(self.record)
+
+    @property
+    def graph(self):
+        """Return the graph followed, or None if it was freed.
+
+        The graph owns its listeners, so it is only weakly referenced.
+
+        :rtype: kukulkan.graph.api.Graph
+        """
+        return self._graph()
+
+    def __len__(self):
+        return (
+            len(self.added_nodes)
+            + len(self.removed_nodes)
+            + len(self.added_attributes)
+            + len(self.removed_attributes)
+            + len(self.connections)
+            + len(self.changed)
+            + len(self.renamed)
+            + len(self.items)
+        )
+
+    def close(self):
+        """Stop following the changes of the graph."""
+        self.graph.listeners.remove(self.record)
+
+    def clear(self):
+        """Forget the recorded changes, after the graph is saved."""
+        self.added_nodes = {}
+        self.removed_nodes = set()
+        self.added_attributes = {}
+        self.removed_attributes = set()
+        self.connections = {}
+        self.changed = {}
+        self.renamed = {}
+        # Items inserted in or removed from lists saved in the base
+        # file, in order, as list, operation, index and item.
+        self.items = []
+
+    def record(self, name, *args):
+        """Record a change notified by the graph."""
+        if name == 'graph.attribute.changed':
+            attribute = args[0]
+            if attribute.node.uuid.hex not in self.added_nodes:
+                self.changed[attribute.id] = attribute
+        elif name == 'graph.connection.added':
+            self._connection(args[0], args[1], True)
+        elif name == 'graph.connection.removed':
+            self._connection(args[0], args[1], False)
+        elif name == 'graph.node.added':
+            self._add_node(args[0])
+        elif name == 'graph.node.removed':
+            self._remove_node(args[0])
+        elif name == 'graph.node.renamed':
+            key = args[0].uuid.hex
+            if key not in self.added_nodes:
+                self.renamed[key] = args[0]
+        elif name == 'graph.attribute.added':
+            self._add_attribute(args[0])
+        elif name == 'graph.attribute.removed':
+            self._remove_attribute(args[0])
+        elif name == 'graph.item.inserted':
+            self._item(args[0], 'insert', args[1], args[2])
+        elif name == 'graph.item.removed':
+            self._forget(args[2])
+            self._item(args[0], 'remove', args[1], args[2])
+
+    def _connection(self, source, destination, added):
+        key = (source.id, destination.id)
+        previous = self.connections.pop(key, None)
+        if previous is None or previous[2] != (not added):
+            self.connections[key] = (source, destination, added)
+
+    def _add_node(self, node):
+        # A node removed then added back stays removed, so that the
+        # patch replaces it with its current state.
+        self.added_nodes[node.uuid.hex] = node
+        for attribute in node.iter_attributes():
+            self.changed.pop(attribute.id, None)
+            for source in attribute.inputs.itervalues():
+                if source.node.graph is self.graph:
+                    self._connection(source, attribute, True)
+            for destination in attribute.iter_outputs():
+                if destination.node.graph is self.graph:
+                    self._connection(attribute, destination, True)
+
+    def _remove_node(self, node):
+        key = node.uuid.hex
+        if self.added_nodes.pop(key, None) is None:
+            self.removed_nodes.add(key)
+        self.renamed.pop(key, None)
+        for attribute in node.iter_attributes():
+            self.changed.pop(attribute.id, None)
+        for connection_key, connection in self.connections.items():
+            if node in (connection[0].node, connection[1].node):
+                del self.connections[connection_key]
+        for attribute_key in self.added_attributes.keys():
+            if attribute_key[0] == key:
+                del self.added_attributes[attribute_key]
+        for attribute_key in list(self.removed_attributes):
+            if attribute_key[0] == key:
+                self.removed_attributes.discard(attribute_key)
+        self.items = [i for i in self.items if i[0].node is not node]
+
+    def _add_attribute(self, attribute):
+        key = (attribute.node.uuid.hex, attribute.name)
+        if key[0] in self.added_nodes:
+            return
+        self.removed_attributes.discard(key)
+        self.added_attributes[key] = attribute
+
+    def _remove_attribute(self, attribute):
+        key = (attribute.node.uuid.hex, attribute.name)
+        if key[0] in self.added_nodes:
+            return
+        if self.added_attributes.pop(key, None) is None:
+            self.removed_attributes.add(key)
+        for item in kukulkan.graph.api.Node._items(attribute):
+            self._forget(item)
+        self.items = [i for i in self.items if i[0] is not attribute]
+
+    def _item(self, parent, operation, index, item):
+        key = (parent.node.uuid.hex, parent.name)
+        # Lists described whole in the patch do not need their changes.
+        if key[0] in self.added_nodes or key in self.added_attributes:
+            return
+        self.items.append((parent, operation, index, item))
+
+    def _forget(self, attribute):
+        """Forget the value and connections of a removed attribute."""
+        self.changed.pop(attribute.id, None)
+        for key, connection in self.connections.items():
+            if attribute in (connection[0], connection[1]):
+                del self.connections[key]
+
+    def patch(self):
+        """Return the recorded changes, as a JSON compatible dict.
+
+        :rtype: dict
+        """
+        class_path = kukulkan.graph.serialization.class_path
+        nodes = []
+        for key, node in self.added_nodes.iteritems():
+            attributes = []
+            for attribute in node.attributes.itervalues():
+                attributes.append(self._describe(attribute))
+            nodes.append({
+                'uuid': key,
+                'type': class_path(type(node)),
+                'name': node.name,
+                'attributes': attributes,
+            })
+        changed = [
+            a for a in self.changed.itervalues()
+            if (a.node.uuid.hex, a.name) not in self.added_attributes
+        ]
+        added = [
+            dict(self._describe(a), node=key[0])
+            for key, a in self.added_attributes.iteritems()
+        ]
+        return {
+            'version': PATCH_VERSION,
+            'nodes': {
+                'added': nodes,
+                'removed': sorted(self.removed_nodes),
+            },
+            'attributes': {
+                'added': added,
+                'removed': sorted(self.removed_attributes),
+            },
+            'names': [
+                [key, node.name] for key, node in self.renamed.iteritems()
+            ],
+            'items': [
+                [
+                    parent.node.uuid.hex,
+                    parent.name,
+                    operation,
+                    index,
+                    self._describe(item) if operation == 'insert' else None,
+                ]
+                for parent, operation, index, item in self.items
+            ],
+            'connections': [
+                [attribute_path(source), attribute_path(destination), added]
+                for source, destination, added in self.connections.values()
+            ],
+            'values': [
+                [attribute_path(a), _encode(a.value)] for a in changed
+            ],
+        }
+
+    @staticmethod
+    def _describe(attribute):
+        """Return the name, type and value of an attribute."""
+        description = {
+            'name': attribute.name,
+            'type': kukulkan.graph.serialization.class_path(type(attribute)),
+        }
+        if isinstance(attribute, kukulkan.graph.api.AttributeList):
+            description['items'] = [
+                Journal._describe(item) for item in attribute
+            ]
+        else:
+            description['value'] = _encode(attribute.value)
+        return description
+
+    def save_patch(self, path):
+        """Write the recorded changes to a patch file, then clear them.
+
+        :param str path: Path of the patch file to write.
+        """
+        with open(path, 'w') as fh:
+            json.dump(self.patch(), fh)
+        self.clear()
+
+    def compact(self, path):
+        """Save the whole graph to a file, then clear the changes.
+
+        The patches written before are not needed anymore to load the
+        graph from this file.
+
+        :param str path: Path of the graph file to write.
+        """
+        kukulkan.graph.serialization.save(self.graph, path)
+        self.clear()
+
+
+def apply_patch(graph, path):
+    """Apply the changes of a patch file on a graph.
+
+    :param kukulkan.graph.api.Graph graph: Graph to change.
+    :param str path: Path of the patch file written by `Journal.save_patch`.
+    :raise ValueError: If the patch version is not supported.
+    """
+    with open(path) as fh:
+        patch = json.load(fh)
+    if patch['version'] > PATCH_VERSION:
+        err = 'Unsupported patch version {}.'.format(patch['version'])
+        raise ValueError(err)
+    import_class = kukulkan.graph.serialization.import_class
+    nodes = dict((n.uuid.hex, n) for n in graph.nodes.values())
+    with graph.batch():
+        for key in patch['nodes']['removed']:
+            graph.remove_node(nodes.pop(key))
+        for key, name in patch.get('names', ()):
+            nodes[key].name = name
+        for key, name in patch['attributes']['removed']:
+            nodes[key].remove_attribute(name)
+        for description in patch['nodes']['added']:
+            node = import_class(description['type'])(description['name'])
+            node.uuid = uuid.UUID(description['uuid'])
+            for attribute in description['attributes']:
+                _restore(node, attribute)
+            nodes[description['uuid']] = graph.add_node(node)
+        for description in patch['attributes']['added']:
+            _restore(nodes[description['node']], description)
+        for key, name, operation, index, description in patch.get('items', ()):
+            node = nodes[key]
+            items = node.attribute_names[name]
+            if operation == 'insert':
+                item = import_class(description['type'])(
+                    description['name'],
+                    node,
+                )
+                _set(item, description['value'])
+                items.insert(index, item)
+            else:
+                del items[index]
+        for path, value in patch['values']:
+            attribute = find_attribute(nodes, path)
+            old = attribute.value
+            attribute.value = attribute.validate_value(value)
+            attribute.set_dirty()
+            graph.notify('graph.attribute.changed', attribute, old)
+        for source, destination, added in patch['connections']:
+            source = find_attribute(nodes, source)
+            destination = find_attribute(nodes, destination)
+            if added:
+                source.connect(destination)
+            else:
+                source.disconnect(destination)
+
+
+def _restore(node, description):
+    """Create or update the attribute of a node described in a patch."""
+    import_class = kukulkan.graph.serialization.import_class
+    attribute = node.attribute_names.get(description['name'])
+    if attribute is None:
+        cls = import_class(description['type'])
+        attribute = node.add_attribute(description['name'], cls)
+    if 'items' in description:
+        for item in description['items']:
+            value = import_class(item['type'])(item['name'], node)
+            attribute.append(value)
+            _set(value, item['value'])
+    else:
+        _set(attribute, description['value'])
+
+
+def _set(attribute, value):
+    """Restore the value of an attribute, keeping its default if unset."""
+    if value is not None:
+        attribute.value = attribute.validate_value(value)
+
+
+def load(path, patches=(), lazy=False):
+    """Load a graph file, then apply patches on it in order.
+
+    :param str path: Path of the graph file.
+    :param list patches: Paths of the patch files to apply.
+    :param bool lazy: Build the nodes on demand, see
+                      `kukulkan.graph.serialization.load`. Applying a
+                      patch builds every node.
+    :rtype: kukulkan.graph.api.Graph
+    """
+    graph = kukulkan.graph.serialization.load(path, lazy=lazy)
+    for patch in patches:
+        apply_patch(graph, patch)
+    return graph
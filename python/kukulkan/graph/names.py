@@ -0,0 +1,145 @@
+"""Lookup of graph nodes by name.
+
+Names can be queried in several ways:
+
+    * ``exact``: the name itself.
+    * ``prefix``: names starting with the pattern.
+    * ``glob``: shell-style wildcards, like ``L_arm_*_ctrl``.
+    * ``regex``: regular expressions, matched at the start of the name
+      like `re.match`.
+
+Prefix and glob queries only visit the sorted names sharing the literal
+prefix of the pattern.
+"""
+import bisect
+import fnmatch
+import re
+
+
+KINDS = ('exact', 'prefix', 'glob', 'regex')
+
+_WILDCARDS = re.compile(r'[*?[]')
+
+
+def compile_query(pattern, kind):
+    """Return the literal prefix and the regex of a query.
+
+    :param str pattern: Pattern to look for.
+    :param str kind: One of `KINDS`.
+    :return: The prefix of the matching names, and the regex they must
+             match or None.
+    :rtype: tuple(str, re.RegexObject)
+    :raise ValueError: If the kind is not supported.
+    """
+    if kind == 'exact' or kind == 'prefix':
+        return pattern, None
+    if kind == 'glob':
+        wildcard = _WILDCARDS.search(pattern)
+        if wildcard is None:
+            return pattern, re.compile(re.escape(pattern) + r'\Z')
+        prefix = pattern[:wildcard.start()]
+        return prefix, re.compile(fnmatch.translate(pattern))
+    if kind == 'regex':
+        return '', re.compile(pattern)
+    raise ValueError('Unknown query kind {}.'.format(kind))
+
+
+def matching(names, pattern, kind='exact'):
+    """Return the names matching a query.
+
+    :param list names: Sorted names to look into.
+    :param str pattern: Pattern to look for.
+    :param str kind: One of `KINDS`.
+    :rtype: list(str)
+    """
+    prefix, regex = compile_query(pattern, kind)
+    start = bisect.bisect_left(names, prefix)
+    if kind == 'exact':
+        if start < len(names) and names[start] == pattern:
+            return [pattern]
+        return []
+    found = []
+    for index in xrange(start, len(names)):
+        name = names[index]
+        if not name.startswith(prefix):
+            break
+        if regex is None or regex.match(name):
+            found.append(name)
+    return found
+
+
+class NameIndex(object):
+    """Nodes of a graph by name.
+
+    Several nodes can share a name. The sorted list of names used by
+    the queries is only updated when queried, so that adding many
+    nodes does not insert their names one by one.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self._sorted = []
+        self._added = set()
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def add(self, node, name=None):
+        """Index a node under its name.
+
+        :param str name: Name to use instead of the node name.
+        """
+        name = node.name if name is None else name
+        nodes = self.nodes.get(name)
+        if nodes is None:
+            self.nodes[name] = [node]
+            self._added.add(name)
+        else:
+            nodes.append(node)
+
+    def remove(self, node, name=None):
+        """Forget a node indexed under its name.
+
+        :param str name: Name to use instead of the node name.
+        """
+        name = node.name if name is None else name
+        nodes = self.nodes[name]
+        nodes.remove(node)
+        if nodes:
+            return
+        del self.nodes[name]
+        if name in self._added:
+            self._added.discard(name)
+        else:
+            del self._sorted[bisect.bisect_left(self._sorted, name)]
+
+    def rename(self, node, old_name):
+        """Index a node under its new name."""
+        self.remove(node, old_name)
+        self.add(node)
+
+    def names(self):
+        """Return the names of the indexed nodes, sorted.
+
+        :rtype: list(str)
+        """
+        if self._added:
+            self._sorted.extend(self._added)
+            self._sorted.sort()
+            self._added.clear()
+        return self._sorted
+
+    def find(self, pattern, kind='exact'):
+        """Return the nodes whose name matches a query.
+
+        :param str pattern: Pattern to look for.
+        :param str kind: One of `KINDS`.
+        :rtype: list
+        """
+        if kind == 'exact':
+            return list(self.nodes.get(pattern, ()))
+        return [
+            node
+            for name in matching(self.names(), pattern, kind)
+            for node in self.nodes[name]
+        ]
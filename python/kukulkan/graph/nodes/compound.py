@@ -0,0 +1,116 @@
+"""Nodes evaluating a graph shared by all their instances.
+
+A `Definition` wraps a graph and exposes some of its attributes as
+inputs and outputs. A `Compound` subclass evaluates a definition:
+
+    class Finger(Compound):
+        definition = Definition(
+            finger_graph,
+            inputs=[('base', 'phalanx0.parent')],
+            outputs=[('tip', 'phalanx2.world')],
+        )
+
+Instances only own their interface attributes. The nodes of the
+definition graph, and the compiled region evaluating them, exist once
+for every instance. Instances evaluated by different threads, like
+with `kukulkan.graph.api.Graph.evaluate_parallel`, take turns to
+evaluate their definition.
+"""
+import copy
+import threading
+
+from kukulkan.graph.api import Node
+
+
+class Definition(object):
+    """A graph evaluated as a function of some of its attributes.
+
+    Input attributes must not be connected in the graph.
+
+    :param kukulkan.graph.api.Graph graph: Graph of the definition.
+    :param list inputs: Name and attribute, or attribute path, of each
+                        input.
+    :param list outputs: Name and attribute, or attribute path, of each
+                         output.
+    :raise ValueError: If an input is connected.
+    """
+
+    def __init__(self, graph, inputs, outputs):
+        self.graph = graph
+        self.inputs = [(n, self._attribute(a)) for n, a in inputs]
+        self.outputs = [(n, self._attribute(a)) for n, a in outputs]
+        for name, attribute in self.inputs:
+            if attribute.inputs:
+                err = 'Input {} of the definition is connected.'
+                raise ValueError(err.format(attribute))
+        self.region = graph.compile()
+        self.lock = threading.Lock()
+
+    def _attribute(self, attribute):
+        """Return the attribute at a path of the graph."""
+        if isinstance(attribute, basestring):
+            return self.graph.resolve(attribute)
+        return attribute
+
+    def interface(self):
+        """Return the name, class and default value of the inputs and outputs.
+
+        :rtype: list(tuple(str, type, object))
+        """
+        return [
+            (name, type(attribute), attribute.value)
+            for name, attribute in self.inputs + self.outputs
+        ]
+
+    def evaluate(self, values):
+        """Return copies of the outputs computed from the specified inputs.
+
+        The definition graph is shared, so a single thread evaluates it
+        at a time.
+
+        :param list values: Value of each input.
+        :rtype: list
+        """
+        with self.lock:
+            for (_, attribute), value in zip(self.inputs, values):
+                attribute.value = value
+            self.region.evaluate()
+            return [copy.copy(a.get()) for _, a in self.outputs]
+
+
+class Compound(Node):
+    """A node evaluating the `Definition` set on its class.
+
+    Inputs and outputs of the definition are added as attributes of
+    each instance, initialized with their value in the definition.
+    """
+
+    definition = None
+
+    def _generate_builtin_attributes(self):
+        super(Compound, self)._generate_builtin_attributes()
+        for name, attribute_class, value in self.definition.interface():
+            attribute = self.add_attribute(name, attribute_class)
+            attribute.value = copy.copy(value)
+
+    def run(self):
+        """Evaluate the definition with the inputs of this node."""
+        attributes = self.attribute_names
+        definition = self.definition
+        values = [attributes[n].get() for n, _ in definition.inputs]
+        outputs = definition.evaluate(values)
+        for (name, _), value in zip(definition.outputs, outputs):
+            attributes[name].value = value
+
+
+def compound_class(name, definition):
+    """Return a `Compound` subclass evaluating a definition.
+
+    Classes created this way cannot be imported, so graphs using them
+    cannot be loaded from a file. Declare the class in a module instead.
+
+    :param str name: Name of the class.
+    :param Definition definition: Definition of the class.
+    :rtype: type
+    """
+    return type(name, (Compound,), {'definition': definition})
@@ -1,25 +1,88 @@
+import weakref
+
+import numpy
+
 from kukulkan.graph.api import Node
 from kukulkan.graph.attributes.matrix import XForm
 
 
 class Transform(Node):
-    """A transformation node."""
+    """A transformation node.
+
+    Transforms can be parented to each other, their world matrices are
+    computed by a `kukulkan.graph.hierarchy.Hierarchy`.
+    """
 
     builtin_attributes = {
         'xform': XForm,
     }
 
+    def __init__(self, name):
+        self._parent = None
+        self.children = []
+        self.hierarchy = None
+        super(Transform, self).__init__(name)
+
+    def __getstate__(self):
+        state = super(Transform, self).__getstate__()
+        state['_parent'] = None
+        state['children'] = []
+        state['hierarchy'] = None
+        return state
+
+    @property
+    def parent(self):
+        """Return the parent of this transform.
+
+        Parents own their children, and are only weakly referenced.
+        Reparenting a transform invalidates its hierarchy.
+
+        :rtype: Transform or None
+        """
+        if self._parent is None:
+            return None
+        return self._parent()
+
+    @parent.setter
+    def parent(self, parent):
+        previous = self.parent
+        if previous is not None:
+            previous.children.remove(self)
+        self._parent = None if parent is None else weakref.ref(parent)
+        if parent is not None:
+            parent.children.append(self)
+        if self.hierarchy is not None:
+            self.hierarchy.invalidate()
+
+    def run(self):
+        """Send the local matrix to the hierarchy of this transform."""
+        if self.hierarchy is not None:
+            self.hierarchy.set_local(self, self.xform.get())
+
+    def world(self):
+        """Return the world matrix of this transform.
+
+        Pending changes of the graph are evaluated first.
+
+        :rtype: numpy.ndarray
+        """
+        if self.hierarchy is None:
+            raise ValueError('{} is not part of a hierarchy.'.format(self))
+        if self.graph is not None:
+            self.graph.evaluate()
+        return self.hierarchy.world(self)
+
     def translation(self):
         """Return the translations of this node."""
-        matrix = self.get()
+        matrix = self.xform.get()
         return matrix[0][3], matrix[1][3], matrix[2][3]
 
     def rotation(self):
-        """Return the rotation of this node."""
-        matrix = self.get()
-        return matrix[0][3], matrix[1][3], matrix[2][3]
+        """Return the rotation matrix of this node."""
+        matrix = self.xform.get()
+        return matrix[:3, :3] / self.scale()
 
     def scale(self):
         """Return the scale of this node."""
-        matrix = self.get()
-        return matrix[0][0], matrix[1][1], matrix[2][2]
+        matrix = self.xform.get()
+        return tuple(numpy.linalg.norm(matrix[:3, :3], axis=0))
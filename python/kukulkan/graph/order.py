@@ -0,0 +1,88 @@
+"""Dynamic topological ordering of graph nodes.
+
+The order is maintained incrementally with the Pearce-Kelly algorithm:
+adding an edge that already respects the order costs nothing, otherwise
+only the nodes lying between both ends of the edge are visited and
+reordered.
+"""
+
+
+class TopologicalOrder(object):
+    """Keep a topological order of nodes up to date as edges are added.
+
+    :param upstream: Callable returning the nodes driving a node.
+    :param downstream: Callable returning the nodes driven by a node.
+    """
+
+    def __init__(self, upstream, downstream):
+        self.upstream = upstream
+        self.downstream = downstream
+        self.positions = {}
+        self._next = 0
+
+    def __contains__(self, node):
+        return node in self.positions
+
+    def add(self, node):
+        """Add a node at the end of the order."""
+        self.positions[node] = self._next
+        self._next += 1
+
+    def remove(self, node):
+        """Remove a node from the order.
+
+        Removing nodes or edges never breaks a topological order.
+        """
+        del self.positions[node]
+
+    def sort(self, nodes):
+        """Return the specified nodes sorted topologically.
+
+        :rtype: list
+        """
+        return sorted(nodes, key=self.positions.__getitem__)
+
+    def add_edge(self, source, destination):
+        """Update the order for an edge going from source to destination.
+
+        :raise ValueError: If the edge would create a cycle.
+        """
+        if source is destination:
+            raise ValueError('{} cannot drive itself.'.format(source))
+        positions = self.positions
+        lower = positions[destination]
+        upper = positions[source]
+        if lower > upper:
+            return
+        forward = self._visit(destination, self.downstream, upper, source)
+        backward = self._visit(source, self.upstream, lower, None)
+        nodes = self.sort(backward) + self.sort(forward)
+        indices = sorted(positions[n] for n in nodes)
+        for node, index in zip(nodes, indices):
+            positions[node] = index
+
+    def _visit(self, start, neighbours, bound, target):
+        """Return the nodes reachable from start within the bound.
+
+        Forward visits only go through nodes placed before ``bound``,
+        backward visits only through nodes placed after it.
+
+        :raise ValueError: If ``target`` is reached.
+        """
+        positions = self.positions
+        forward = target is not None
+        visited = set([start])
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for other in neighbours(node):
+                if other is target:
+                    err = 'Connecting {} to {} would create a cycle.'
+                    raise ValueError(err.format(target, start))
+                if other in visited or other not in positions:
+                    continue
+                position = positions[other]
+                if (position < bound) if forward else (position > bound):
+                    visited.add(other)
+                    stack.append(other)
+        return visited
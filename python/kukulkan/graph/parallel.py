@@ -0,0 +1,83 @@
+"""Helpers running independent graph nodes concurrently."""
+import time
+
+
+class EvaluationReport(object):
+    """Statistics gathered during a parallel evaluation.
+
+    :param list(int) widths: Number of nodes run in each wave.
+    :param float busy: Cumulated run time of all the nodes, in seconds.
+    :param float wall: Duration of the whole evaluation, in seconds.
+    """
+
+    def __init__(self, widths, busy, wall):
+        self.widths = widths
+        self.busy = busy
+        self.wall = wall
+
+    def __str__(self):
+        msg = (
+            '{nodes} nodes in {waves} waves '
+            '(max width {width}, mean width {mean:.2f}), '
+            'speedup {speedup:.2f}'
+        )
+        return msg.format(
+            nodes=self.nodes,
+            waves=len(self.widths),
+            width=max(self.widths or [0]),
+            mean=self.mean_width,
+            speedup=self.speedup,
+        )
+
+    @property
+    def nodes(self):
+        """Number of nodes run."""
+        return sum(self.widths)
+
+    @property
+    def mean_width(self):
+        """Mean number of nodes that could run at the same time."""
+        if not self.widths:
+            return 0.0
+        return float(self.nodes) / len(self.widths)
+
+    @property
+    def speedup(self):
+        """Ratio of the cumulated run time over the wall time.
+
+        This is the parallelism actually achieved by the executor.
+        """
+        if not self.wall:
+            return 0.0
+        return self.busy / self.wall
+
+
+def run(node):
+    """Run a node in place and return the time it took.
+
+    Used by thread pools, which share the nodes with the caller.
+    The run is recorded by the profiler of the graph, if any.
+    """
+    start = time.time()
+    graph = node.graph
+    if graph is None or graph.profiler is None:
+        node.run()
+    else:
+        graph.profiler.run(node)
+    return time.time() - start
+
+
+def run_detached(node):
+    """Run a copy of a node and return its values and when it ran.
+
+    Used by process pools, which receive a pickled copy of the node.
+    Values are keyed by attribute id, to be applied back on the
+    original node.
+
+    :return: The values, the start time and the duration of the run.
+    :rtype: tuple(dict, float, float)
+    """
+    start = time.time()
+    node.run()
+    values = dict((a.id, a.value) for a in node.iter_attributes())
+    return values, start, time.time() - start
@@ -0,0 +1,212 @@
+"""Profiling of graph evaluations.
+
+Set a `Profiler` as the profiler of a graph to time every node run::
+
+    with profile(graph) as profiler:
+        graph.evaluate()
+    print profiler.report()
+    profiler.save_trace('evaluation.json')
+
+The trace can be opened in ``chrome://tracing`` or Perfetto.
+
+Nodes run by `kukulkan.graph.api.Graph.evaluate_parallel` are recorded
+too. A compiled `kukulkan.graph.compiler.Region` runs its nodes in a
+single function, so it is recorded as a whole, as a single run.
+Graphs without a profiler only pay for a ``None`` check per node run
+and per dirty propagation.
+"""
+import collections
+import contextlib
+import json
+import time
+
+
+class NodeStats(object):
+    """Runs of a node.
+
+    :param node: Node profiled.
+    """
+
+    __slots__ = ('node', 'count', 'total', 'triggers')
+
+    def __init__(self, node):
+        self.node = node
+        self.count = 0
+        self.total = 0.0
+        self.triggers = collections.Counter()
+
+    @property
+    def mean(self):
+        """Mean duration of a run, in seconds."""
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def trigger(self):
+        """Name of the attribute that most often made the node dirty.
+
+        :rtype: str
+        """
+        if not self.triggers:
+            return '-'
+        return self.triggers.most_common(1)[0][0]
+
+
+class Profiler(object):
+    """Time the node runs of a graph.
+
+    The attribute whose change made a node dirty is recorded as the
+    trigger of its next run.
+
+    :param bool trace: Keep every run, for `Profiler.trace`.
+    """
+
+    def __init__(self, trace=True):
+        self.tracing = trace
+        self.clear()
+
+    def clear(self):
+        """Forget every recorded run."""
+        self.stats = {}
+        self.events = []
+        self.triggers = {}
+        self.start = time.time()
+
+    def run(self, node):
+        """Run a node and record the duration of the run."""
+        start = time.time()
+        try:
+            node.run()
+        finally:
+            self.record(node, start, time.time() - start)
+
+    def record(self, node, start, duration, nodes=None):
+        """Record a run that already took place.
+
+        :param node: Node run, or object running several nodes at once,
+                     like a compiled region.
+        :param float start: Time the run started at.
+        :param float duration: Duration of the run, in seconds.
+        :param list nodes: Nodes run by the object, whose triggers are
+                           attributed to it.
+        """
+        trigger = None
+        for other in nodes or [node]:
+            other_trigger = self.triggers.pop(other, None)
+            if trigger is None:
+                trigger = other_trigger
+        trigger = '-' if trigger is None else str(trigger)
+        stats = self.stats.get(node)
+        if stats is None:
+            stats = self.stats[node] = NodeStats(node)
+        stats.count += 1
+        stats.total += duration
+        stats.triggers[trigger] += 1
+        if self.tracing:
+            self.events.append((node, trigger, start, duration))
+
+    def by_type(self):
+        """Return the runs aggregated by node type.
+
+        :return: Run count and total duration, by node type name.
+        :rtype: dict(str, tuple(int, float))
+        """
+        types = {}
+        for stats in self.stats.itervalues():
+            name = type(stats.node).__name__
+            count, total = types.get(name, (0, 0.0))
+            types[name] = (count + stats.count, total + stats.total)
+        return types
+
+    def hot_nodes(self, limit=None):
+        """Return the stats of the nodes, the most expensive first.
+
+        :param int limit: Maximum number of nodes to return.
+        :rtype: list(NodeStats)
+        """
+        stats = sorted(
+            self.stats.itervalues(),
+            key=lambda s: s.total,
+            reverse=True,
+        )
+        return stats[:limit]
+
+    def report(self, limit=20):
+        """Return a text report of the most expensive nodes and types.
+
+        :param int limit: Number of nodes to list.
+        :rtype: str
+        """
+        total = sum(s.total for s in self.stats.itervalues())
+        lines = ['{:<32} {:>8} {:>10} {:>10} {:>6}  {}'.format(
+            'node', 'runs', 'total ms', 'mean ms', '%', 'trigger',
+        )]
+        for stats in self.hot_nodes(limit):
+            lines.append('{:<32} {:>8} {:>10.3f} {:>10.3f} {:>6.1f}  {}'.format(
+                str(stats.node)[:32],
+                stats.count,
+                stats.total * 1000,
+                stats.mean * 1000,
+                stats.total / total * 100 if total else 0,
+                stats.trigger,
+            ))
+        lines.append('')
+        lines.append('{:<32} {:>8} {:>10} {:>10} {:>6}'.format(
+            'type', 'runs', 'total ms', 'mean ms', '%',
+        ))
+        types = sorted(
+            self.by_type().iteritems(),
+            key=lambda item: item[1][1],
+            reverse=True,
+        )
+        for name, (count, type_total) in types:
+            lines.append('{:<32} {:>8} {:>10.3f} {:>10.3f} {:>6.1f}'.format(
+                name[:32],
+                count,
+                type_total * 1000,
+                type_total / count * 1000,
+                type_total / total * 100 if total else 0,
+            ))
+        return '\n'.join(lines)
+
+    def trace(self):
+        """Return the recorded runs in the Chrome trace event format.
+
+        :rtype: dict
+        """
+        events = []
+        for node, trigger, start, duration in self.events:
+            events.append({
+                'name': str(node),
+                'cat': type(node).__name__,
+                'ph': 'X',
+                'ts': (start - self.start) * 1e6,
+                'dur': duration * 1e6,
+                'pid': 0,
+                'tid': 0,
+                'args': {'trigger': trigger},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_trace(self, path):
+        """Write the recorded runs to a Chrome trace file.
+
+        :param str path: Path of the JSON file to write.
+        """
+        with open(path, 'w') as fh:
+            json.dump(self.trace(), fh)
+
+
+@contextlib.contextmanager
+def profile(graph, trace=True):
+    """Profile the evaluations of a graph.
+
+    :param kukulkan.graph.api.Graph graph: Graph to profile.
+    :param bool trace: Keep every run, for `Profiler.trace`.
+    :rtype: Profiler
+    """
+    previous = graph.profiler
+    profiler = graph.profiler = Profiler(trace)
+    try:
+        yield profiler
+    finally:
+        graph.profiler = previous
@@ -0,0 +1,658 @@
+"""Compact binary file format for graphs.
+
+A file is made of a fixed header followed by these sections, each one
+aligned on 16 bytes:
+
+    * The string table: string lengths, then the UTF-8 encoded strings.
+    * The node table: uuid, type and name of each node, and the range
+      of its attributes in the attribute table.
+    * The attribute table: node, parent list, name, type and value of
+      each attribute.
+    * The connection table: source and destination attribute indices.
+    * The matrix segments: attribute type, offset and count of each
+      packed matrix buffer.
+    * The matrix buffers: float64 (N, 4, 4) arrays, one per attribute
+      type, memory-mapped when the file is loaded.
+
+Nodes are written in evaluation order, so that loading never has to
+reorder them.
+"""
+import contextlib
+import gc
+import importlib
+import json
+import os
+import struct
+import tempfile
+import uuid
+import weakref
+from collections import MutableMapping
+
+import numpy
+
+import kukulkan.graph.api
+import kukulkan.graph.names
+
+
+MAGIC = 'KUKG'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHIIIII5Q')
+_ALIGNMENT = 16
+
+NODES = numpy.dtype([
+    ('uuid', 'u1', (16,)),
+    ('type', '<u4'),
+    ('name', '<u4'),
+    ('first_attribute', '<u4'),
+    ('attribute_count', '<u4'),
+])
+ATTRIBUTES = numpy.dtype([
+    ('node', '<u4'),
+    ('parent', '<i4'),
+    ('name', '<u4'),
+    ('type', '<u4'),
+    ('kind', 'u1'),
+    ('value', '<i8'),
+])
+CONNECTIONS = numpy.dtype([
+    ('source', '<u4'),
+    ('destination', '<u4'),
+])
+SEGMENTS = numpy.dtype([
+    ('type', '<u4'),
+    ('offset', '<u8'),
+    ('count', '<u4'),
+])
+
+# Kinds of attribute values.
+DEFAULT = 0
+MATRIX = 1
+JSON = 2
+LIST = 3
+
+
+def class_path(cls):
+    """Return the importable path of a class.
+
+    :rtype: str
+    """
+    return '{}.{}'.format(cls.__module__, cls.__name__)
+
+
+def import_class(path):
+    """Return the class found at the specified importable path."""
+    module, name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)
+
+
+def is_packed(attribute):
+    """Return whether an attribute value goes in a matrix buffer.
+
+    :rtype: bool
+    """
+    return (
+        getattr(attribute, 'dtype', None) == numpy.float64
+        and attribute.shape == (4, 4)
+    )
+
+
+class _Strings(object):
+    """Deduplicated table of strings."""
+
+    def __init__(self):
+        self.strings = []
+        self.indices = {}
+
+    def __call__(self, string):
+        if isinstance(string, unicode):
+            string = string.encode('utf-8')
+        index = self.indices.get(string)
+        if index is None:
+            index = self.indices[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def tobytes(self):
+        lengths = numpy.array(map(len, self.strings), dtype='<u4')
+        return lengths.tobytes() + ''.join(self.strings)
+
+
+def save(graph, path):
+    """Save a graph to a file.
+
+    :param kukulkan.graph.api.Graph graph: Graph to save.
+    :param str path: Path of the file to write.
+    """
+    strings = _Strings()
+    nodes = graph.schedule()
+    node_rows = []
+    attributes = []
+    attribute_rows = []
+    matrices = {}
+    for index, node in enumerate(nodes):
+        first = len(attributes)
+        for attribute in node.attributes.itervalues():
+            items = []
+            if isinstance(attribute, kukulkan.graph.api.AttributeList):
+                items = list(attribute)
+            parent = len(attributes)
+            for item in [attribute] + items:
+                attributes.append(item)
+                attribute_rows.append((
+                    index,
+                    parent if item is not attribute else -1,
+                    strings(item.name),
+                    strings(class_path(type(item))),
+                ) + _value(item, strings, matrices))
+        node_rows.append((
+            strings(class_path(type(node))),
+            strings(node.name),
+            first,
+            len(attributes) - first,
+        ))
+    node_table = numpy.zeros(len(nodes), dtype=NODES)
+    if nodes:
+        uuids = ''.join(node.uuid.bytes for node in nodes)
+        node_table['uuid'] = numpy.frombuffer(uuids, dtype='u1').reshape(-1, 16)
+        for name, column in zip(NODES.names[1:], zip(*node_rows)):
+            node_table[name] = column
+
+    attribute_table = numpy.array(attribute_rows, dtype=ATTRIBUTES)
+    attribute_indices = dict((a, i) for i, a in enumerate(attributes))
+    connections = [
+        (attribute_indices[source], attribute_indices[destination])
+        for destination in attributes
+        if isinstance(destination, kukulkan.graph.api.Attribute)
+        for source in destination.inputs.itervalues()
+        if source in attribute_indices
+    ]
+    connection_table = numpy.array(connections, dtype=CONNECTIONS)
+
+    buffers = [
+        (strings(class_path(cls)), numpy.array(values, dtype=numpy.float64))
+        for cls, values in matrices.iteritems()
+    ]
+    sections = [
+        strings.tobytes(),
+        node_table.tobytes(),
+        attribute_table.tobytes(),
+        connection_table.tobytes(),
+    ]
+    offset = _align(_HEADER.size)
+    offsets = []
+    for section in sections:
+        offsets.append(offset)
+        offset = _align(offset + len(section))
+    segment_table = numpy.zeros(len(buffers), dtype=SEGMENTS)
+    offsets.append(offset)
+    offset = _align(offset + segment_table.nbytes)
+    for row, (type_index, values) in zip(segment_table, buffers):
+        row['type'] = type_index
+        row['offset'] = offset
+        row['count'] = len(values)
+        offset = _align(offset + values.nbytes)
+    sections.append(segment_table.tobytes())
+    sections.extend(values.tobytes() for _, values in buffers)
+    offsets.extend(int(row['offset']) for row in segment_table)
+
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        0,
+        len(strings.strings),
+        len(nodes),
+        len(attributes),
+        len(connections),
+        len(buffers),
+        *offsets[:5]
+    )
+    # Written next to the target then renamed over it: graphs loaded
+    # from the target keep their matrices mapped on the previous file.
+    handle, temporary = tempfile.mkstemp(
+        prefix='.' + os.path.basename(path),
+        dir=os.path.dirname(os.path.abspath(path)),
+    )
+    try:
+        with os.fdopen(handle, 'wb') as fh:
+            fh.write(header)
+            for offset, section in zip(offsets, sections):
+                fh.write('\0' * (offset - fh.tell()))
+                fh.write(section)
+        os.chmod(temporary, _file_mode(path))
+        _replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _file_mode(path):
+    """Return the permissions of a file, or of a new file if it is missing.
+    """
+    if os.path.exists(path):
+        return os.stat(path).st_mode & 0o7777
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _replace(source, destination):
+    """Rename a file over another one."""
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # Windows does not rename over an existing file.
+        if not os.path.exists(destination):
+            raise
+        os.remove(destination)
+        os.rename(source, destination)
+
+
+def _value(attribute, strings, matrices):
+    """Return the kind and encoded value of an attribute."""
+    if isinstance(attribute, kukulkan.graph.api.AttributeList):
+        return LIST, len(attribute)
+    value = attribute.value
+    if is_packed(attribute) and value is not None:
+        values = matrices.setdefault(type(attribute), [])
+        values.append(value)
+        return MATRIX, len(values) - 1
+    if value is None or value is attribute.default_value:
+        return DEFAULT, 0
+    if isinstance(value, numpy.ndarray):
+        value = value.tolist()
+    return JSON, strings(json.dumps(value))
+
+
+def _align(offset):
+    """Return the next offset aligned on `_ALIGNMENT` bytes."""
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class GraphFile(object):
+    """Tables of a graph file, read without building any node.
+
+    Matrix buffers are memory-mapped, in copy-on-write mode, so that
+    the file is never modified through them.
+
+    :param str path: Path of the file to read.
+    :raise ValueError: If the file is not a supported graph file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            header = fh.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:4] != MAGIC:
+                raise ValueError('{} is not a graph file.'.format(path))
+            values = _HEADER.unpack(header)
+            version = values[1]
+            if version > VERSION:
+                err = 'Unsupported graph file version {}.'
+                raise ValueError(err.format(version))
+            counts = values[3:8]
+            offsets = values[8:]
+            string_count, node_count, attribute_count = counts[:3]
+            connection_count, segment_count = counts[3:]
+
+            fh.seek(offsets[0])
+            lengths = numpy.fromfile(fh, dtype='<u4', count=string_count)
+            blob = fh.read(int(lengths.sum()))
+            ends = numpy.cumsum(lengths)
+            self.strings = [
+                blob[end - length:end].decode('utf-8')
+                for length, end in zip(lengths, ends)
+            ]
+            self.nodes = self._read(fh, offsets[1], NODES, node_count)
+            self.attributes = self._read(
+                fh,
+                offsets[2],
+                ATTRIBUTES,
+                attribute_count,
+            )
+            self.connections = self._read(
+                fh,
+                offsets[3],
+                CONNECTIONS,
+                connection_count,
+            )
+            segments = self._read(fh, offsets[4], SEGMENTS, segment_count)
+        self.matrices = {}
+        for segment in segments:
+            self.matrices[self.strings[segment['type']]] = numpy.memmap(
+                path,
+                dtype=numpy.float64,
+                mode='c',
+                offset=int(segment['offset']),
+                shape=(int(segment['count']), 4, 4),
+            )
+        self._classes = {}
+        self._node_rows = None
+        self._attribute_rows = None
+
+    @staticmethod
+    def _read(fh, offset, dtype, count):
+        fh.seek(offset)
+        return numpy.fromfile(fh, dtype=dtype, count=count)
+
+    def _rows(self, table):
+        """Return the rows of a table as tuples of Python values.
+
+        Reading Python values is a lot faster than indexing numpy
+        records one by one.
+        """
+        names = [n for n in table.dtype.names if n != 'uuid']
+        return zip(*(table[name].tolist() for name in names))
+
+    def node_class(self, index):
+        """Return the class of the node stored at the specified index."""
+        return self._class(self._node_rows[index][0])
+
+    def _class(self, string):
+        """Return the class whose path is at the specified string index."""
+        cls = self._classes.get(string)
+        if cls is None:
+            cls = self._classes[string] = import_class(self.strings[string])
+        return cls
+
+    def build_node(self, index, stores=None):
+        """Create the node stored at the specified index, without connections.
+
+        :param int index: Index of the node in the node table.
+        :param dict stores: Stores using a matrix buffer of this file as
+                            array, by attribute type path. Matrices of
+                            these types are bound to their row instead of
+                            being copied.
+        :return: The node and its attributes, in file order.
+        :rtype: tuple(kukulkan.graph.api.Node, list)
+        """
+        if self._node_rows is None:
+            self._node_rows = self._rows(self.nodes)
+            self._attribute_rows = self._rows(self.attributes)
+            uuids = numpy.ascontiguousarray(self.nodes['uuid'])
+            halves = uuids.view('>u8').tolist()
+            self._uuids = [(high << 64) | low for high, low in halves]
+        strings = self.strings
+        type_index, name, first, count = self._node_rows[index]
+        node = self._class(type_index)(strings[name])
+        node.uuid = uuid.UUID(int=self._uuids[index])
+        attributes = []
+        for row in self._attribute_rows[first:first + count]:
+            name = strings[row[2]]
+            cls = self._class(row[3])
+            if row[1] >= 0:
+                attribute = cls(name, node)
+                attributes[row[1] - first].append(attribute)
+            elif name in node.attribute_names:
+                attribute = node.attribute_names[name]
+            else:
+                attribute = node.add_attribute(name, cls)
+            attributes.append(attribute)
+            self._set_value(attribute, row[4], row[5], stores or {})
+        return node, attributes
+
+    def _set_value(self, attribute, kind, value, stores):
+        """Restore the value of an attribute from its table row."""
+        if kind == MATRIX:
+            path = class_path(type(attribute))
+            if path in stores:
+                attribute.bind(stores[path], value)
+            else:
+                attribute.value = self.matrices[path][value]
+        elif kind == JSON:
+            value = json.loads(self.strings[value])
+            attribute.value = attribute.validate_value(value)
+
+
+def load(path, graph=None, lazy=False):
+    """Load a graph from a file.
+
+    Matrix values stay memory-mapped: they are used as the graph matrix
+    stores and only copied in memory when modified.
+
+    With ``lazy`` loading, nodes are only built when they are first
+    accessed through `Graph.nodes` or `Graph.find`, see `LazyNodes`.
+
+    :param str path: Path of the file to read.
+    :param graph: Graph to load into, a new one by default.
+    :type graph: kukulkan.graph.api.Graph
+    :param bool lazy: Build the nodes on demand.
+    :rtype: kukulkan.graph.api.Graph
+    """
+    graph_file = GraphFile(path)
+    if graph is None:
+        graph = kukulkan.graph.api.Graph()
+    stores = map_stores(graph, graph_file)
+    if lazy:
+        graph.nodes = LazyNodes(graph, graph_file, stores, graph.nodes)
+        return graph
+    attributes = []
+    with _collection_paused(), graph.batch():
+        for index in xrange(len(graph_file.nodes)):
+            node, node_attributes = graph_file.build_node(index, stores)
+            attributes.extend(node_attributes)
+            graph.add_node(node)
+        for source, destination in graph_file.connections:
+            attributes[source].connect(attributes[destination])
+    return graph
+
+
+@contextlib.contextmanager
+def _collection_paused():
+    """Pause the garbage collector.
+
+    Building a graph only creates objects that stay alive, so the
+    collections triggered by these allocations scan the whole graph
+    again and again without freeing anything.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class LazyNodes(MutableMapping):
+    """Nodes of a graph, built from a graph file when first accessed.
+
+    Ids are reserved for all the nodes of the file when it is opened, so
+    that the keys of this mapping are known without building anything.
+    Accessing a node builds it with the nodes it depends on, then
+    connects its inputs. Its outputs get connected when the nodes they
+    drive are built, which `LazyNodes.load_downstream` does before the
+    graph answers downstream queries.
+
+    Iterating over the values of this mapping builds every node.
+
+    :param kukulkan.graph.api.Graph graph: Graph owning the nodes.
+    :param GraphFile graph_file: File to build the nodes from.
+    :param dict stores: Stores using the file matrix buffers.
+    :param dict nodes: Nodes already in the graph.
+    """
+
+    def __init__(self, graph, graph_file, stores, nodes=None):
+        self._graph = weakref.ref(graph)
+        self.graph_file = graph_file
+        self.stores = stores
+        self.loaded = dict(nodes or {})
+        count = len(graph_file.nodes)
+        self.first_id = kukulkan.graph.api.reserve_ids(count)
+        self.pending = set(xrange(count))
+        self.attributes = {}
+        self._attribute_nodes = graph_file.attributes['node']
+        self._edges = None
+        self._starts = None
+        self._driven = None
+        self._driven_starts = None
+        self._names = None
+
+    @property
+    def graph(self):
+        """Return the graph owning the nodes, or None if it was freed.
+
+        The graph owns this mapping, so it is only weakly referenced.
+
+        :rtype: kukulkan.graph.api.Graph
+        """
+        return self._graph()
+
+    def __getitem__(self, key):
+        node = self.loaded.get(key)
+        if node is None:
+            if self._index(key) not in self.pending:
+                raise KeyError(key)
+            self.load(self._index(key))
+            node = self.loaded[key]
+        return node
+
+    def __setitem__(self, key, node):
+        self.loaded[key] = node
+
+    def __delitem__(self, key):
+        self[key]
+        del self.loaded[key]
+        index = self._index(key)
+        if 0 <= index < len(self.graph_file.nodes):
+            row = self.graph_file.nodes[index]
+            first = int(row['first_attribute'])
+            for attribute in xrange(first, first + int(row['attribute_count'])):
+                self.attributes.pop(attribute, None)
+
+    def __contains__(self, key):
+        return key in self.loaded or self._index(key) in self.pending
+
+    def __iter__(self):
+        for key in self.loaded.keys():
+            yield key
+        for index in sorted(self.pending):
+            yield self.first_id + index
+
+    def __len__(self):
+        return len(self.loaded) + len(self.pending)
+
+    def _index(self, key):
+        """Return the file index of the node with the specified id."""
+        return key - self.first_id
+
+    def _incoming(self, index):
+        """Return the connections driving the node at the given index.
+
+        :rtype: list(tuple(int, int))
+        """
+        if self._edges is None:
+            connections = self.graph_file.connections
+            destinations = self._attribute_nodes[connections['destination']]
+            order = numpy.argsort(destinations, kind='mergesort')
+            self._edges = connections[order]
+            self._starts = numpy.searchsorted(
+                destinations[order],
+                numpy.arange(len(self.graph_file.nodes) + 1),
+            ).tolist()
+        edges = self._edges[self._starts[index]:self._starts[index + 1]]
+        return edges.tolist()
+
+    def _outgoing(self, index):
+        """Return the file indices of the nodes driven by a node.
+
+        :rtype: set(int)
+        """
+        if self._driven is None:
+            connections = self.graph_file.connections
+            sources = self._attribute_nodes[connections['source']]
+            order = numpy.argsort(sources, kind='mergesort')
+            destinations = connections['destination'][order]
+            self._driven = self._attribute_nodes[destinations]
+            self._driven_starts = numpy.searchsorted(
+                sources[order],
+                numpy.arange(len(self.graph_file.nodes) + 1),
+            ).tolist()
+        start, end = self._driven_starts[index:index + 2]
+        return set(self._driven[start:end].tolist())
+
+    def load_downstream(self, key):
+        """Build the nodes driven by the node with the specified id.
+
+        :param int key: Id of a node of the graph.
+        """
+        index = self._index(key)
+        if not 0 <= index < len(self.graph_file.nodes):
+            return
+        for other in self._outgoing(index):
+            self.load(other)
+
+    def load(self, index):
+        """Build the node at the specified file index and its dependencies."""
+        if index not in self.pending:
+            return
+        needed = set([index])
+        stack = [index]
+        while stack:
+            for source, _ in self._incoming(stack.pop()):
+                upstream = int(self._attribute_nodes[source])
+                if upstream in self.pending and upstream not in needed:
+                    needed.add(upstream)
+                    stack.append(upstream)
+        with self.graph.muted():
+            # Nodes are stored in evaluation order.
+            for index in sorted(needed):
+                self._build(index)
+
+    def _build(self, index):
+        """Build a node, add it to the graph and connect its inputs."""
+        self.pending.discard(index)
+        node, attributes = self.graph_file.build_node(index, self.stores)
+        node.id = self.first_id + index
+        first = int(self.graph_file.nodes['first_attribute'][index])
+        for offset, attribute in enumerate(attributes):
+            self.attributes[first + offset] = attribute
+        self.graph.add_node(node)
+        for source, destination in self._incoming(index):
+            # Sources of nodes removed since they were built are gone.
+            source = self.attributes.get(source)
+            if source is not None:
+                source.connect(self.attributes[destination])
+
+    def load_matching(self, pattern, kind='exact'):
+        """Build the nodes whose name matches a query.
+
+        Nodes renamed since they were built are looked up in
+        `kukulkan.graph.api.Graph.names` instead.
+
+        :param str pattern: Pattern to look for.
+        :param str kind: One of `kukulkan.graph.names.KINDS`.
+        """
+        if self._names is None:
+            self._names = {}
+            names = self.graph_file.nodes['name'].tolist()
+            for index, string in enumerate(names):
+                key = self.graph_file.strings[string]
+                self._names.setdefault(key, []).append(index)
+            self._sorted_names = sorted(self._names)
+        names = kukulkan.graph.names.matching(self._sorted_names, pattern, kind)
+        for name in names:
+            for index in self._names[name]:
+                self.load(index)
+
+
+def map_stores(graph, graph_file):
+    """Use the memory-mapped matrix buffers as the graph matrix stores.
+
+    Buffers whose type already has a store in the graph are skipped,
+    their values will be copied in the existing store.
+
+    :return: The stores using a buffer, by attribute type path.
+    :rtype: dict
+    """
+    stores = {}
+    for path, array in graph_file.matrices.iteritems():
+        cls = import_class(path)
+        if cls in graph.stores:
+            continue
+        store = graph.store(cls)
+        store.array = array
+        store.size = len(array)
+        stores[path] = store
+    return stores
@@ -0,0 +1,85 @@
+"""Contiguous storage of graph attribute values."""
+import numpy
+
+
+class MatrixStore(object):
+    """Store the matrices of many attributes in a single array.
+
+    Each attribute owns a row of `MatrixStore.array`, referenced by its
+    index. Reading all the rows of a set of attributes, or writing them,
+    is then a single array operation.
+
+    The array grows by doubling its capacity. Views of rows taken before
+    a growth are not updated anymore, so they should not be kept.
+
+    :param tuple shape: Shape of a stored matrix.
+    :param dtype: Type of the stored items.
+    :param int capacity: Initial number of rows.
+    """
+
+    def __init__(self, shape, dtype, capacity=64):
+        self.shape = shape
+        self.dtype = dtype
+        self.array = numpy.empty((capacity,) + shape, dtype=dtype)
+        self.size = 0
+        self.free = []
+
+    def __len__(self):
+        return self.size - len(self.free)
+
+    def allocate(self, value):
+        """Store a matrix in a free row.
+
+        :return: Index of the row.
+        :rtype: int
+        """
+        if self.free:
+            index = self.free.pop()
+        else:
+            if self.size == len(self.array):
+                self._grow()
+            index = self.size
+            self.size += 1
+        self.array[index] = value
+        return index
+
+    def release(self, index):
+        """Free a row so that it can be allocated again."""
+        self.free.append(index)
+
+    def _grow(self):
+        """Double the capacity of the array."""
+        capacity = max(len(self.array) * 2, 1)
+        array = numpy.empty((capacity,) + self.shape, dtype=self.dtype)
+        array[:self.size] = self.array[:self.size]
+        self.array = array
+
+    def indices(self, attributes):
+        """Return the rows of the specified attributes.
+
+        :rtype: numpy.ndarray
+        """
+        return numpy.fromiter(
+            (a.index for a in attributes),
+            dtype=numpy.intp,
+            count=len(attributes),
+        )
+
+    def gather(self, attributes):
+        """Return a copy of the matrices of the specified attributes.
+
+        :rtype: numpy.ndarray
+        """
+        return self.array[self.indices(attributes)]
+
+    def scatter(self, attributes, values):
+        """Write the matrices of the specified attributes at once.
+
+        The attributes are flagged dirty, but not validated.
+
+        :param list attributes: Attributes stored in this store.
+        :param numpy.ndarray values: One matrix per attribute.
+        """
+        self.array[self.indices(attributes)] = values
+        for attribute in attributes:
+            attribute.set_dirty()
@@ -0,0 +1,144 @@
+"""Build rigs from character templates in parallel.
+
+A template is the importable path of a function building a graph for a
+character, called with the name of the character::
+
+    python build_rigs.py my_rigs.biped:alice my_rigs.biped:bob \\
+        my_rigs.quadruped:rex --output /tmp/rigs --workers 8
+
+Templates are imported from the current folder, or from the Python
+path. Each rig is built in a worker process and saved in the output
+folder as ``<name>.kkg``. The name of a character defaults to the name
+of its template function, and must be unique.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.serialization
+
+
+def parse_job(spec):
+    """Return the template path and character name of a job.
+
+    :param str spec: ``template`` or ``template:name``.
+    :rtype: tuple(str, str)
+    """
+    template, _, name = spec.partition(':')
+    return template, name or template.rsplit('.', 1)[-1]
+
+
+def build(job):
+    """Build a rig and save it, in a worker process.
+
+    Errors are returned instead of raised, so that a failing job does
+    not stop the others.
+
+    :param tuple job: Template path, character name and output folder.
+    :return: The job, the path written or None, the duration of the
+             job in seconds and the formatted error if it failed.
+    :rtype: tuple
+    """
+    template, name, folder = job
+    start = time.time()
+    try:
+        function = kukulkan.graph.serialization.import_class(template)
+        graph = function(name)
+        path = os.path.join(folder, name + '.kkg')
+        kukulkan.graph.serialization.save(graph, path)
+    except Exception:
+        return job, None, time.time() - start, traceback.format_exc()
+    return job, path, time.time() - start, None
+
+
+def run(jobs, workers):
+    """Build the jobs and yield their results as they finish.
+
+    :param list jobs: Jobs accepted by `build`.
+    :param int workers: Number of worker processes, 0 to build the jobs
+                        in this process.
+    """
+    if not workers:
+        for job in jobs:
+            yield build(job)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(build, jobs):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'templates',
+        nargs='*',
+        help='Template function paths, as template or template:name.',
+    )
+    parser.add_argument(
+        '--jobs',
+        help='File listing one template per line, like the arguments.',
+    )
+    parser.add_argument('--output', default='.', help='Output folder.')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of worker processes, 0 to build in this process.',
+    )
+    args = parser.parse_args(args)
+
+    specs = list(args.templates)
+    if args.jobs:
+        with open(args.jobs) as fh:
+            specs.extend(l.strip() for l in fh if l.strip())
+    if not specs:
+        parser.error('No template to build.')
+    jobs = [parse_job(spec) + (args.output,) for spec in specs]
+    names = set()
+    for _, name, _ in jobs:
+        if name in names:
+            parser.error('Several jobs build {}.'.format(name))
+        names.add(name)
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    # Workers inherit the path, to import templates of the current folder.
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+    start = time.time()
+    failures = []
+    for (template, name, _), path, duration, error in run(jobs, args.workers):
+        status = 'ok' if error is None else 'FAILED'
+        print '{:<24} {:>8.2f}s  {}'.format(name, duration, status)
+        sys.stdout.flush()
+        if error is not None:
+            failures.append((template, name, error))
+
+    print '\n{} rigs built, {} failed in {:.2f}s with {} workers.'.format(
+        len(jobs) - len(failures),
+        len(failures),
+        time.time() - start,
+        args.workers,
+    )
+    for template, name, error in failures:
+        print '\n{} ({}):\n{}'.format(name, template, error.rstrip())
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Benchmark the graph core on synthetic rigs.
+
+Rigs of several shapes and sizes are built node by node, then the time
+of each graph operation is measured. Results are written as JSON::
+
+    python tests/benchmark.py --sizes 100 1000 --output results.json
+
+Save a baseline once, then compare later runs against it. The run
+fails when an operation is slower than its baseline by more than the
+tolerance::
+
+    python tests/benchmark.py --output baseline.json
+    python tests/benchmark.py --baseline baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+import numpy
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+import kukulkan.graph.attributes.matrix
+
+
+SIZES = [100, 1000, 10000, 100000]
+OPERATIONS = [
+    'add_node',
+    'add_attribute',
+    'connect',
+    'set',
+    'evaluate',
+    'get',
+]
+
+# Operations faster than this in the baseline are too noisy to compare.
+NOISE = 0.02
+
+
+class PassThrough(kukulkan.graph.api.Node):
+
+    builtin_attributes = {
+        'input': kukulkan.graph.api.Attribute,
+        'output': kukulkan.graph.api.Attribute,
+    }
+
+    def run(self):
+        self.output.value = self.input.get()
+
+
+class Joint(kukulkan.graph.api.Node):
+
+    builtin_attributes = {
+        'parent': kukulkan.graph.attributes.matrix.XForm,
+        'local': kukulkan.graph.attributes.matrix.XForm,
+        'world': kukulkan.graph.attributes.matrix.XForm,
+    }
+
+    def run(self):
+        self.world.value = self.parent.get().dot(self.local.get())
+
+
+class Control(kukulkan.graph.api.Node):
+
+    builtin_attributes = {
+        'xform': kukulkan.graph.attributes.matrix.XForm,
+    }
+
+
+# Joints of a biped, with the index of their parent.
+BIPED = [('root', None), ('hips', 0)]
+BIPED += [('spine{}'.format(i), i + 1) for i in xrange(3)]
+BIPED += [('neck', 4), ('head', 5)]
+for side in 'LR':
+    start = len(BIPED)
+    BIPED += [
+        ('clavicle' + side, 4),
+        ('upperarm' + side, start),
+        ('forearm' + side, start + 1),
+        ('hand' + side, start + 2),
+    ]
+    for finger in ('thumb', 'index', 'middle', 'ring', 'pinky'):
+        hand = start + 3
+        for phalanx in xrange(3):
+            BIPED.append((
+                '{}{}{}'.format(finger, phalanx, side),
+                hand if not phalanx else len(BIPED) - 1,
+            ))
+    start = len(BIPED)
+    BIPED += [
+        ('thigh' + side, 1),
+        ('calf' + side, start),
+        ('foot' + side, start + 1),
+        ('toe' + side, start + 2),
+    ]
+
+
+def chain(size):
+    """Return a single chain of ``size`` nodes."""
+    nodes = [(PassThrough, 'node{}'.format(i)) for i in xrange(size)]
+    edges = [(i - 1, 'output', i, 'input') for i in xrange(1, size)]
+    return nodes, edges, [(0, 'input', 1.0)]
+
+
+def fan_out(size):
+    """Return a node driving ``size - 1`` nodes."""
+    nodes = [(PassThrough, 'node{}'.format(i)) for i in xrange(size)]
+    edges = [(0, 'output', i, 'input') for i in xrange(1, size)]
+    return nodes, edges, [(0, 'input', 1.0)]
+
+
+def tree(size):
+    """Return a balanced binary tree of ``size`` nodes."""
+    nodes = [(PassThrough, 'node{}'.format(i)) for i in xrange(size)]
+    edges = [((i - 1) // 2, 'output', i, 'input') for i in xrange(1, size)]
+    return nodes, edges, [(0, 'input', 1.0)]
+
+
+def biped(size):
+    """Return bipeds made of joints driven by controls.
+
+    Characters are added until the rig has at least ``size`` nodes.
+    """
+    nodes = []
+    edges = []
+    inputs = []
+    pose = numpy.identity(4)
+    pose[:3, 3] = 1
+    character = 0
+    while len(nodes) < size:
+        first = len(nodes)
+        for name, parent in BIPED:
+            name = 'c{}_{}'.format(character, name)
+            nodes.append((Joint, name))
+            nodes.append((Control, name + '_ctl'))
+            joint = len(nodes) - 2
+            edges.append((joint + 1, 'xform', joint, 'local'))
+            if parent is not None:
+                edges.append((first + parent * 2, 'world', joint, 'parent'))
+            inputs.append((joint + 1, 'xform', pose))
+        character += 1
+    return nodes, edges, inputs
+
+
+SHAPES = {
+    'chain': chain,
+    'fan_out': fan_out,
+    'tree': tree,
+    'biped': biped,
+}
+
+
+def run(shape, size):
+    """Build a rig and time each graph operation on it.
+
+    :return: Total time and count of each operation.
+    :rtype: dict
+    """
+    nodes, edges, inputs = SHAPES[shape](size)
+    nodes = [cls(name) for cls, name in nodes]
+    graph = kukulkan.graph.api.Graph()
+    results = {}
+
+    def timed(operation, calls):
+        # Collections triggered by earlier allocations are not timed.
+        gc.collect()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.time()
+            count = 0
+            for call in calls:
+                call()
+                count += 1
+            seconds = time.time() - start
+        finally:
+            if enabled:
+                gc.enable()
+        results[operation] = {'seconds': seconds, 'count': count}
+
+    timed('add_node', (lambda n=n: graph.add_node(n) for n in nodes))
+    timed('add_attribute', (
+        lambda n=n: n.add_attribute('extra', kukulkan.graph.api.Attribute)
+        for n in nodes
+    ))
+    pairs = [
+        (getattr(nodes[s], sa), getattr(nodes[d], da))
+        for s, sa, d, da in edges
+    ]
+    timed('connect', (lambda s=s, d=d: s.connect(d) for s, d in pairs))
+    graph.evaluate()
+    timed('set', (
+        lambda a=getattr(nodes[n], name), v=value: a.set(v)
+        for n, name, value in inputs
+    ))
+    timed('evaluate', [graph.evaluate])
+    leaves = [
+        attribute
+        for node in nodes
+        for attribute in node.attributes.itervalues()
+        if not attribute.outputs and attribute.name != 'extra'
+    ]
+    timed('get', (lambda a=a: a.get() for a in leaves))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the operations slower than their baseline.
+
+    Times are compared per call, so that baselines stay valid when
+    generators change their node count slightly.
+
+    :rtype: list(str)
+    """
+    regressions = []
+    for shape, sizes in sorted(results.iteritems()):
+        for size, operations in sorted(sizes.iteritems()):
+            reference = baseline.get(shape, {}).get(size, {})
+            for operation, result in sorted(operations.iteritems()):
+                if operation not in reference:
+                    continue
+                before = reference[operation]
+                if before['seconds'] < NOISE:
+                    continue
+                ratio = (
+                    (result['seconds'] / max(result['count'], 1))
+                    / (before['seconds'] / max(before['count'], 1))
+                )
+                if ratio > 1 + tolerance:
+                    regressions.append(
+                        '{} {} {}: {:.0%} slower'.format(
+                            shape,
+                            size,
+                            operation,
+                            ratio - 1,
+                        )
+                    )
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--shapes',
+        nargs='+',
+        choices=sorted(SHAPES),
+        default=sorted(SHAPES),
+    )
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Keep the best time of several runs.',
+    )
+    parser.add_argument('--output', help='Path of the JSON results.')
+    parser.add_argument('--baseline', help='Path of the JSON baseline.')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=.25,
+        help='Slowdown allowed before failing, .25 for 25%%.',
+    )
+    args = parser.parse_args(args)
+
+    results = {}
+    for shape in args.shapes:
+        for size in args.sizes:
+            best = None
+            for _ in xrange(args.repeat):
+                result = run(shape, size)
+                if best is None:
+                    best = result
+                for operation, timing in result.iteritems():
+                    if timing['seconds'] < best[operation]['seconds']:
+                        best[operation] = timing
+            # JSON keys are strings, keep them comparable with a baseline.
+            results.setdefault(shape, {})[str(size)] = best
+            print '{} {}: {}'.format(shape, size, ', '.join(
+                '{} {:.3f}s'.format(operation, best[operation]['seconds'])
+                for operation in OPERATIONS
+            ))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print >> sys.stderr, 'Regression: ' + regression
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
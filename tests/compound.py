@@ -0,0 +1,142 @@
+import multiprocessing.pool
+import os
+import sys
+import time
+
+import numpy
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+import kukulkan.graph.attributes.matrix
+import kukulkan.graph.nodes.compound
+
+
+class Phalanx(kukulkan.graph.api.Node):
+
+    builtin_attributes = {
+        'parent': kukulkan.graph.attributes.matrix.XForm,
+        'local': kukulkan.graph.attributes.matrix.XForm,
+        'world': kukulkan.graph.attributes.matrix.XForm,
+    }
+
+    def run(self):
+        self.world.value = self.parent.get().dot(self.local.get())
+
+    def compile(self):
+        return ['{world} = {parent}.dot({local})']
+
+
+def offset(distance):
+    matrix = numpy.identity(4)
+    matrix[0, 3] = distance
+    return matrix
+
+
+def build_finger(graph, name, phalanges=3):
+    """Add the phalanges of a finger to a graph."""
+    nodes = []
+    for index in xrange(phalanges):
+        phalanx = graph.add_node(Phalanx('{}{}'.format(name, index)))
+        phalanx.local.set(offset(1.0 / (index + 1)))
+        if nodes:
+            nodes[-1].world.connect(phalanx.parent)
+        nodes.append(phalanx)
+    return nodes
+
+
+def finger_definition():
+    graph = kukulkan.graph.api.Graph()
+    build_finger(graph, 'phalanx')
+    return kukulkan.graph.nodes.compound.Definition(
+        graph,
+        inputs=[('base', 'phalanx0.parent'), ('curl', 'phalanx1.local')],
+        outputs=[('tip', 'phalanx2.world')],
+    )
+
+
+class Finger(kukulkan.graph.nodes.compound.Compound):
+
+    definition = finger_definition()
+
+
+def test_compound():
+    graph = kukulkan.graph.api.Graph()
+    fingers = [graph.add_node(Finger('finger{}'.format(i))) for i in xrange(4)]
+    assert sorted(fingers[0].attribute_names) == ['base', 'curl', 'tip']
+    for index, finger in enumerate(fingers):
+        finger.base.set(offset(index))
+    fingers[3].curl.set(offset(2))
+    for index, finger in enumerate(fingers[:3]):
+        assert numpy.allclose(finger.tip.get(), offset(index + 1.5 + 1.0 / 3))
+    assert numpy.allclose(fingers[3].tip.get(), offset(3 + 3 + 1.0 / 3))
+
+    # Outputs are copied out of the shared definition graph.
+    tip = fingers[0].tip.get()
+    fingers[1].base.set(offset(10))
+    fingers[1].tip.get()
+    assert numpy.allclose(tip, offset(1.5 + 1.0 / 3))
+
+    fingers[0].tip.connect(fingers[1].base)
+    assert numpy.allclose(fingers[1].tip.get(), offset(2 * (1.5 + 1.0 / 3)))
+
+
+def test_threads():
+    graph = kukulkan.graph.api.Graph()
+    fingers = [graph.add_node(Finger('finger{}'.format(i))) for i in xrange(64)]
+    for index, finger in enumerate(fingers):
+        finger.base.set(offset(index))
+    # Switch threads as often as possible to interleave the evaluations.
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    pool = multiprocessing.pool.ThreadPool(4)
+    try:
+        graph.evaluate_parallel(pool)
+    finally:
+        pool.close()
+        sys.setcheckinterval(interval)
+    for index, finger in enumerate(fingers):
+        assert numpy.allclose(finger.tip.get(), offset(index + 1.5 + 1.0 / 3))
+
+
+def count_attributes(graph):
+    return sum(len(list(n.iter_attributes())) for n in graph.nodes.values())
+
+
+def benchmark(count=40):
+    expanded = kukulkan.graph.api.Graph()
+    for index in xrange(count):
+        build_finger(expanded, 'finger{}_'.format(index))
+    compound = kukulkan.graph.api.Graph()
+    for index in xrange(count):
+        compound.add_node(Finger('finger{}'.format(index)))
+    print '{} fingers: {} nodes, {} attributes expanded'.format(
+        count,
+        len(expanded.nodes),
+        count_attributes(expanded),
+    )
+    print '{} fingers: {} nodes, {} attributes as compounds'.format(
+        count,
+        len(compound.nodes),
+        count_attributes(compound),
+    )
+
+    for graph in (expanded, compound):
+        start = time.time()
+        for _ in xrange(10):
+            for node in graph.nodes.values():
+                node.set_dirty()
+            graph.evaluate()
+        print 'Evaluate: {:.2f}ms'.format((time.time() - start) * 100)
+
+
+if __name__ == '__main__':
+    test_compound()
+    test_threads()
+    benchmark()
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.events
+
+
+def test_wildcards():
+    received = []
+
+    def record(pattern):
+        def func(*args):
+            received.append((pattern, args))
+        return func
+
+    patterns = [
+        'test.config.ui.changed',
+        'test.config.*.changed',
+        'test.config.**',
+        'test.**.changed',
+        'test.*',
+    ]
+    funcs = [record(p) for p in patterns]
+    for pattern, func in zip(patterns, funcs):
+        kukulkan.events.subscribe(func, pattern)
+
+    expected = {
+        'test.config.ui.changed': patterns[:4],
+        'test.config.ui': patterns[2:3],
+        'test.config': patterns[2:3] + patterns[4:],
+        'test.changed': patterns[3:],
+        'test.config.ui.node.changed': patterns[2:4],
+        'test.other': patterns[4:],
+        'other.config.ui.changed': [],
+    }
+    for name, matching in expected.iteritems():
+        del received[:]
+        kukulkan.events.notify(name, 1)
+        assert received == [(p, (1,)) for p in matching], name
+
+    # Subscriptions made after a topic was notified are taken into account.
+    late = record('test.other')
+    kukulkan.events.subscribe(late, 'test.other')
+    del received[:]
+    kukulkan.events.notify('test.other')
+    assert [p for p, _ in received] == ['test.*', 'test.other']
+
+    kukulkan.events.unsubscribe(funcs[4], 'test.*')
+    kukulkan.events.unsubscribe(late, 'test.other')
+    del received[:]
+    kukulkan.events.notify('test.other')
+    assert not received
+    try:
+        kukulkan.events.unsubscribe(late, 'test.other')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Unsubscribed twice.')
+    for pattern, func in zip(patterns[:4], funcs):
+        kukulkan.events.unsubscribe(func, pattern)
+
+
+def benchmark(count=100000):
+    def noop(*args):
+        pass
+
+    kukulkan.events.subscribe(noop, 'bench.exact.removed')
+    kukulkan.events.subscribe(noop, 'bench.*.changed')
+    kukulkan.events.subscribe(noop, 'bench.wildcard.**')
+    for label, name in [
+        ('no subscriber', 'bench.none.removed'),
+        ('1 exact subscriber', 'bench.exact.removed'),
+        ('1 wildcard subscriber', 'bench.exact.changed'),
+        ('2 wildcard subscribers', 'bench.wildcard.changed'),
+    ]:
+        notify = kukulkan.events.notify
+        start = time.time()
+        for _ in xrange(count):
+            notify(name, 1, 2)
+        print 'Notify, {}: {:.2f}us'.format(
+            label,
+            (time.time() - start) * 1e6 / count,
+        )
+
+
+if __name__ == '__main__':
+    test_wildcards()
+    benchmark()
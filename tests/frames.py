@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+
+import numpy
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+import kukulkan.graph.attributes.matrix
+import kukulkan.graph.hierarchy
+import kukulkan.graph.nodes.transform
+
+
+class Joint(kukulkan.graph.api.Node):
+
+    batched = True
+
+    builtin_attributes = {
+        'parent': kukulkan.graph.attributes.matrix.XForm,
+        'local': kukulkan.graph.attributes.matrix.XForm,
+        'world': kukulkan.graph.attributes.matrix.XForm,
+    }
+
+    def run(self):
+        self.world.value = numpy.matmul(self.parent.get(), self.local.get())
+
+
+class FrameJoint(Joint):
+    """Same as `Joint`, run once per frame."""
+
+    batched = False
+
+    def run(self):
+        self.world.value = self.parent.get().dot(self.local.get())
+
+
+def offset(distance):
+    matrix = numpy.identity(4)
+    matrix[0, 3] = distance
+    return matrix
+
+
+def build_chain(graph, count, node_class=Joint):
+    joints = []
+    for index in xrange(count):
+        joint = graph.add_node(node_class('joint{}'.format(index)))
+        joint.local.set(offset(1))
+        if joints:
+            joints[-1].world.connect(joint.parent)
+        joints.append(joint)
+    return joints
+
+
+def animation(frames):
+    """Return a root animation moving along x, one matrix per frame."""
+    values = numpy.tile(numpy.identity(4), (frames, 1, 1))
+    values[:, 0, 3] = numpy.arange(frames)
+    return values
+
+
+def test_evaluate_frames():
+    for node_class in (Joint, FrameJoint):
+        graph = kukulkan.graph.api.Graph()
+        joints = build_chain(graph, 4, node_class)
+        static = graph.add_node(node_class('static'))
+        static.local.set(offset(7))
+        tip = joints[-1].world.get().copy()
+
+        results = graph.evaluate_frames(
+            {joints[0].parent: animation(5)},
+            [joints[-1].world, joints[1].local, static.world],
+        )
+        world = results[joints[-1].world]
+        assert world.shape == (5, 4, 4)
+        assert numpy.allclose(world[:, 0, 3], numpy.arange(5) + 4)
+        assert results[joints[1].local].shape == (5, 4, 4)
+        assert numpy.allclose(results[static.world], offset(7))
+
+        # The graph is left as it was.
+        assert numpy.allclose(joints[-1].world.get(), tip)
+        assert numpy.allclose(joints[0].parent.get(), numpy.identity(4))
+        graph.evaluate()
+        assert numpy.allclose(joints[-1].world.get(), tip)
+
+    # Batched and per-frame nodes can be mixed.
+    graph = kukulkan.graph.api.Graph()
+    joints = build_chain(graph, 2) + build_chain(graph, 2, FrameJoint)
+    joints[1].world.connect(joints[2].parent)
+    results = graph.evaluate_frames(
+        {joints[0].parent: animation(3)},
+        [joints[-1].world],
+    )
+    assert numpy.allclose(results[joints[-1].world][:, 0, 3], [4, 5, 6])
+
+    try:
+        graph.evaluate_frames(
+            {joints[0].parent: animation(3), joints[0].local: animation(2)},
+            [joints[-1].world],
+        )
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Inputs with different frame counts.')
+    try:
+        graph.evaluate_frames({joints[1].parent: animation(3)}, [])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Connected input set.')
+
+
+def test_hierarchy():
+    graph = kukulkan.graph.api.Graph()
+    root = kukulkan.graph.nodes.transform.Transform('root')
+    child = kukulkan.graph.nodes.transform.Transform('child')
+    child.parent = root
+    graph.add_node(root)
+    graph.add_node(child)
+    kukulkan.graph.hierarchy.Hierarchy([root, child])
+    assert child.world()[0, 3] == 0
+
+    values = animation(3)
+    values[:, 0, 3] = [10, 20, 30]
+    graph.evaluate_frames({root.xform: values}, [root.xform])
+    # Transforms run again to restore the local matrices of the hierarchy.
+    assert child.world()[0, 3] == 0
+
+
+def benchmark(count=100, frames=1000):
+    graph = kukulkan.graph.api.Graph()
+    joints = build_chain(graph, count)
+    values = animation(frames)
+
+    start = time.time()
+    baked = []
+    for frame in xrange(frames):
+        joints[0].parent.set(values[frame])
+        baked.append(joints[-1].world.get().copy())
+    print 'Bake {} frames, {} joints, frame by frame: {:.1f}ms'.format(
+        frames,
+        count,
+        (time.time() - start) * 1000,
+    )
+
+    start = time.time()
+    results = graph.evaluate_frames(
+        {joints[0].parent: values},
+        [joints[-1].world],
+    )
+    print 'Bake {} frames, {} joints, batched: {:.1f}ms'.format(
+        frames,
+        count,
+        (time.time() - start) * 1000,
+    )
+    assert numpy.allclose(results[joints[-1].world], baked)
+
+
+if __name__ == '__main__':
+    test_evaluate_frames()
+    test_hierarchy()
+    benchmark()
@@ -1,3 +1,5 @@
+import multiprocessing
+import multiprocessing.pool
 import os
 import random
 import sys
@@ -10,8 +12,551 @@ py_kukulkan = os.path.join(kukulkan_path, 'python')
 sys.path.append(py_kukulkan)
 
 
+import kukulkan.events
+import numpy
+
 import kukulkan.graph.api
+import kukulkan.graph.attributes.matrix
+import kukulkan.graph.history
 import kukulkan.graph.nodes.transform
+import kukulkan.graph.profiler
+
+
+class Counter(kukulkan.graph.api.Node):
+    """A node keeping track of the number of times it ran."""
+
+    builtin_attributes = {
+        'input': kukulkan.graph.api.Attribute,
+        'output': kukulkan.graph.api.Attribute,
+    }
+
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+        self.output.value = self.input.get()
+
+
+class Doubler(kukulkan.graph.api.Node):
+    """A node that can be inlined in compiled regions."""
+
+    builtin_attributes = {
+        'input': kukulkan.graph.api.Attribute,
+        'output': kukulkan.graph.api.Attribute,
+    }
+
+    def run(self):
+        self.output.value = self.input.get() * 2
+
+    def compile(self):
+        return ['{output} = {input} * 2']
+
+
+def test_dirty_propagation():
+    graph = kukulkan.graph.api.Graph()
+    nodes = [graph.add_node(Counter('counter{}'.format(i))) for i in xrange(3)]
+    nodes[0].output.connect(nodes[1].input)
+    nodes[0].input.set(1)
+    graph.evaluate()
+    assert [n.runs for n in nodes] == [1, 1, 1]
+    assert nodes[1].output.get() == 1
+
+    nodes[0].input.set(2)
+    assert nodes[1].dirty and not nodes[2].dirty
+    assert nodes[1].output.get() == 2
+    graph.evaluate()
+    assert [n.runs for n in nodes] == [2, 2, 1]
+
+    nodes[0].output.disconnect(nodes[1].input)
+    nodes[0].input.set(3)
+    graph.evaluate()
+    assert nodes[1].output.get() == 2
+    assert [n.runs for n in nodes] == [3, 3, 1]
+
+
+class Failing(Counter):
+    """A counter raising while `failing` is set."""
+
+    failing = True
+
+    def run(self):
+        if self.failing:
+            raise RuntimeError('Failed to run.')
+        super(Failing, self).run()
+
+
+def test_failed_run():
+    graph = kukulkan.graph.api.Graph()
+    node = graph.add_node(Failing('failing'))
+    node.input.set(1)
+    try:
+        graph.evaluate()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError('The node did not run.')
+    # A node that failed runs again on the next evaluation.
+    assert node.dirty and node in graph.dirty_nodes
+    node.failing = False
+    node.input.set(2)
+    assert node.output.get() == 2
+    assert not node.dirty and not graph.dirty_nodes
+
+
+def test_schedule():
+    graph = kukulkan.graph.api.Graph()
+    nodes = [graph.add_node(Counter('counter{}'.format(i))) for i in xrange(3)]
+    nodes[2].output.connect(nodes[0].input)
+    nodes[0].output.connect(nodes[1].input)
+    schedule = graph.schedule()
+    assert schedule.index(nodes[2]) < schedule.index(nodes[0])
+    assert schedule.index(nodes[0]) < schedule.index(nodes[1])
+    assert graph.schedule() is schedule
+
+    nodes[0].output.disconnect(nodes[1].input)
+    assert graph.schedule() is not schedule
+
+
+def test_deep_chain():
+    graph = kukulkan.graph.api.Graph()
+    nodes = [graph.add_node(Counter('counter{}'.format(i))) for i in xrange(5000)]
+    for source, destination in zip(nodes, nodes[1:]):
+        source.input.connect(destination.input)
+        source.output.connect(destination.output)
+    nodes[0].input.set(1)
+    assert nodes[-1].input.get() == 1
+    assert nodes[-1].output.get() == 1
+    assert nodes[-1].output.source() is nodes[0].output
+
+    nodes[0].input.disconnect(nodes[1].input)
+    nodes[1].input.set(2)
+    assert nodes[-1].input.get() == 2
+    assert nodes[-1].input.source() is nodes[1].input
+
+
+def test_cycle_detection():
+    graph = kukulkan.graph.api.Graph()
+    nodes = [graph.add_node(Counter('counter{}'.format(i))) for i in xrange(4)]
+    nodes[3].output.connect(nodes[2].input)
+    nodes[2].output.connect(nodes[1].input)
+    nodes[1].output.connect(nodes[0].input)
+    for source, destination in [(0, 3), (1, 2), (0, 0)]:
+        try:
+            nodes[source].output.connect(nodes[destination].input)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('Cycle was not detected.')
+    assert graph.schedule() == nodes[::-1]
+
+    # Nodes outside of a graph are checked too.
+    first, second = Counter('first'), Counter('second')
+    first.output.connect(second.input)
+    try:
+        second.input.connect(first.output)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Cycle was not detected outside of a graph.')
+    assert not first.output.inputs
+
+
+def test_remove_node():
+    graph = kukulkan.graph.api.Graph()
+    nodes = [graph.add_node(Counter('counter{}'.format(i))) for i in xrange(3)]
+    nodes[0].output.connect(nodes[1].input)
+    nodes[0].input.connect(nodes[1].input)
+    nodes[1].output.connect(nodes[2].input)
+    assert graph.upstream(nodes[1]) == [nodes[0]]
+    assert graph.downstream(nodes[1]) == [nodes[2]]
+    nodes[0].input.disconnect(nodes[1].input)
+    assert graph.downstream(nodes[0]) == [nodes[1]]
+
+    try:
+        with graph.batch():
+            graph.remove_node(nodes[1])
+            assert not nodes[0].output.outputs and not nodes[2].input.inputs
+            assert not graph.downstream(nodes[0])
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert nodes[1].graph is graph
+    assert graph.upstream(nodes[2]) == [nodes[1]]
+    nodes[0].input.set(5)
+    assert nodes[2].output.get() == 5
+
+    graph.remove_node(nodes[1].id)
+    assert not graph.upstream(nodes[2]) and not graph.downstream(nodes[0])
+    assert not nodes[1].input.inputs and not nodes[1].output.outputs
+    graph.add_node(nodes[1])
+    assert not graph.upstream(nodes[1])
+
+    # Connecting twice counts a single edge.
+    nodes[0].output.connect(nodes[1].input)
+    nodes[0].output.connect(nodes[1].input)
+    nodes[0].output.disconnect(nodes[1].input)
+    assert not graph.downstream(nodes[0])
+    graph.remove_node(nodes[1])
+    nodes[1].output.connect(nodes[0].input)
+    graph.add_node(nodes[1])
+    assert graph.downstream(nodes[1]) == [nodes[0]]
+
+    # A node outside of the graph cannot close a cycle with it.
+    extra = Counter('extra')
+    nodes[2].output.connect(extra.input)
+    try:
+        extra.output.connect(nodes[2].input)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('A cycle was created.')
+    assert not nodes[2].input.inputs
+    graph.add_node(extra)
+    assert graph.downstream(nodes[2]) == [extra]
+    assert not graph.upstream(nodes[2])
+
+
+def test_names():
+    graph = kukulkan.graph.api.Graph()
+    for side in 'LR':
+        for part in ('upperarm', 'forearm', 'hand'):
+            graph.add_node(Counter('{}_arm_{}_ctrl'.format(side, part)))
+    weights = graph.find('L_arm_hand_ctrl')[0].add_attribute(
+        'weights',
+        kukulkan.graph.api.AttributeList,
+    )
+    weights.append(kukulkan.graph.api.Attribute('w0', weights.node))
+
+    names = lambda nodes: sorted(n.name for n in nodes)
+    assert names(graph.search('L_arm_*_ctrl')) == [
+        'L_arm_forearm_ctrl',
+        'L_arm_hand_ctrl',
+        'L_arm_upperarm_ctrl',
+    ]
+    assert len(graph.search('R_', 'prefix')) == 3
+    assert names(graph.search('[LR]_arm_hand', 'regex')) == [
+        'L_arm_hand_ctrl',
+        'R_arm_hand_ctrl',
+    ]
+    assert not graph.search('L_arm_*_ctr')
+
+    node = graph.find('R_arm_hand_ctrl')[0]
+    with graph.batch():
+        node.name = 'R_hand_ctrl'
+        assert graph.find('R_hand_ctrl') == [node]
+        assert not graph.find('R_arm_hand_ctrl')
+    graph.remove_node(node)
+    assert not graph.search('R_hand*')
+    assert len(graph.search('*')) == 5
+
+    assert graph.resolve('L_arm_hand_ctrl.input') is weights.node.input
+    assert graph.resolve('L_arm_hand_ctrl.weights[0]') is weights[0]
+    for path in ('L_arm_hand_ctrl.weights[1]', 'missing.input'):
+        try:
+            graph.resolve(path)
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('{} was resolved.'.format(path))
+
+
+def test_batch():
+    graph = kukulkan.graph.api.Graph()
+    events = []
+    for name in ['graph.node.added', 'graph.attribute.changed']:
+        kukulkan.events.subscribe(lambda *args: events.append(args), name)
+    first = graph.add_node(Counter('first'))
+    first.input.set(0)
+    graph.evaluate()
+    del events[:]
+
+    with graph.batch():
+        second = graph.add_node(Counter('second'))
+        first.output.connect(second.input)
+        for value in xrange(10):
+            first.input.set(value)
+        assert not first.dirty
+        assert not events
+    assert len(events) == 2
+    assert events[1] == (graph, first.input, 0)
+    assert second.output.get() == 9
+
+    try:
+        with graph.batch():
+            third = graph.add_node(Counter('third'))
+            second.output.connect(third.input)
+            first.input.set(42)
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert third.graph is None and not second.output.outputs
+    assert first.input.get() == 9
+
+    # Interruptions roll back too, and leave the graph out of the batch.
+    try:
+        with graph.batch():
+            first.input.set(7)
+            raise KeyboardInterrupt()
+    except KeyboardInterrupt:
+        pass
+    assert graph._batch is None
+    assert first.input.get() == 9
+    del events[:]
+    first.input.set(3)
+    assert events == [(graph, first.input, 9)]
+
+
+def test_matrix_store():
+    graph = kukulkan.graph.api.Graph()
+    transforms = []
+    for index in xrange(100):
+        name = 'trs{}'.format(index)
+        transform = kukulkan.graph.nodes.transform.Transform(name)
+        transform.xform.set(numpy.identity(4) * index)
+        transforms.append(graph.add_node(transform))
+    store = graph.store(kukulkan.graph.attributes.matrix.XForm)
+    attributes = [t.xform for t in transforms]
+    assert len(store) == 100
+    assert transforms[3].xform.get().base is store.array
+    # Views of the store cannot be written to, only `set` or `scatter` can.
+    try:
+        transforms[4].xform.get()[0, 0] = 42
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Store written through a view.')
+    assert store.array[transforms[4].xform.index][0, 0] == 4
+    assert store.array.flags.writeable
+
+    pose = store.gather(attributes)
+    store.scatter(attributes, -pose)
+    assert transforms[3].dirty
+    assert transforms[3].xform.get()[0][0] == -3
+
+    graph.remove_node(transforms[3])
+    assert len(store) == 99
+    assert transforms[3].xform.get()[0][0] == -3
+
+
+def test_matrix_validation():
+    node = kukulkan.graph.nodes.transform.Transform('trs')
+    xform = node.xform
+    for value in ([[1, 2], [3, 4]], numpy.identity(3), 'matrix', None):
+        try:
+            xform.validate_value(value)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('{} was accepted.'.format(value))
+
+    rows = [[float(r == c) * 2 for c in xrange(4)] for r in xrange(4)]
+    array = xform.validate_value(rows)
+    assert type(array) is numpy.ndarray
+    assert array.dtype == numpy.float64 and array.shape == (4, 4)
+    assert numpy.array_equal(array, numpy.identity(4) * 2)
+    assert xform.validate_value(numpy.identity(4, dtype=int)).dtype == float
+    # Arrays of the right type and shape are used as is.
+    assert xform.validate_value(array) is array
+
+
+def add_list(node, name, attribute_class, count):
+    items = node.add_attribute(name, kukulkan.graph.api.AttributeList)
+    for index in xrange(count):
+        items.append(attribute_class('{}{}'.format(name, index), node))
+    return items
+
+
+def test_attribute_list():
+    graph = kukulkan.graph.api.Graph()
+    source = graph.add_node(kukulkan.graph.api.Node('source'))
+    blend = graph.add_node(kukulkan.graph.api.Node('blend'))
+    XForm = kukulkan.graph.attributes.matrix.XForm
+    matrices = add_list(source, 'matrices', XForm, 200)
+    inputs = add_list(blend, 'inputs', XForm, 200)
+    weights = add_list(blend, 'weights', kukulkan.graph.api.Attribute, 200)
+    assert str(inputs) == 'blend.inputs'
+
+    matrices.connect(inputs)
+    assert inputs[42].source() is matrices[42]
+    pose = numpy.arange(200 * 16, dtype=float).reshape(200, 4, 4)
+    matrices.set(pose)
+    assert numpy.array_equal(inputs.get_array(), pose)
+    try:
+        inputs.set(pose)
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError('Connected items were set.')
+    try:
+        matrices.set(numpy.zeros((200, 3, 3)))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Matrices of the wrong shape were set.')
+    assert numpy.array_equal(matrices.get_array(), pose)
+
+    weights.set(numpy.linspace(0, 1, 200))
+    assert weights.get_array()[-1] == 1
+    try:
+        matrices.connect(add_list(blend, 'short', XForm, 10))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Lists of different lengths were connected.')
+    matrices.disconnect(inputs)
+    assert not any(i.inputs for i in inputs)
+
+
+def test_profiler():
+    graph = kukulkan.graph.api.Graph()
+    nodes = [graph.add_node(Counter('counter{}'.format(i))) for i in xrange(3)]
+    nodes[0].output.connect(nodes[1].input)
+    nodes[1].output.connect(nodes[2].input)
+    graph.evaluate()
+
+    with kukulkan.graph.profiler.profile(graph) as profiler:
+        for value in xrange(3):
+            nodes[0].input.set(value)
+            graph.evaluate()
+    assert graph.profiler is None
+    stats = profiler.stats[nodes[2]]
+    assert stats.count == 3 and stats.trigger == 'counter0.input'
+    assert profiler.by_type()['Counter'][0] == 9
+    assert 'counter2' in profiler.report()
+    events = profiler.trace()['traceEvents']
+    assert len(events) == 9 and events[0]['ph'] == 'X'
+    assert events[-1]['args']['trigger'] == 'counter0.input'
+
+
+def test_compiled_region():
+    graph = kukulkan.graph.api.Graph()
+    root = graph.add_node(Counter('root'))
+    nodes = [
+        graph.add_node(cls('node{}'.format(i)))
+        for i, cls in enumerate([Doubler, Counter, Doubler])
+    ]
+    root.output.connect(nodes[0].input)
+    nodes[0].output.connect(nodes[1].input)
+    nodes[1].output.connect(nodes[2].input)
+    region = graph.compile(nodes)
+    assert graph.compile(nodes) is region
+
+    root.input.set(3)
+    region.evaluate()
+    assert root.runs == 1 and nodes[1].runs == 1
+    assert not graph.dirty_nodes and not nodes[2].output.dirty
+    assert nodes[2].output.get() == 12
+    assert 'o' in region.source and '* 2' in region.source
+
+    tail = graph.add_node(Doubler('tail'))
+    nodes[2].output.connect(tail.input)
+    root.input.set(1)
+    region.evaluate()
+    assert nodes[2].output.value == 4 and tail.dirty
+    assert tail.output.get() == 8
+
+    # Profiled regions are recorded as a single run.
+    with kukulkan.graph.profiler.profile(graph) as profiler:
+        root.input.set(2)
+        region.evaluate()
+    assert profiler.stats[root].count == 1
+    stats = profiler.stats[region]
+    assert stats.count == 1 and stats.trigger == 'root.input'
+    assert profiler.by_type()['Region'][0] == 1
+    assert profiler.triggers.keys() == [tail]
+
+
+def test_history():
+    graph = kukulkan.graph.api.Graph()
+    history = kukulkan.graph.history.History(graph)
+    first = graph.add_node(Counter('first'))
+    first.input.set(1)
+    initial = history.snapshot('Create')
+    assert len(initial) == 2
+
+    second = graph.add_node(Counter('second'))
+    first.output.connect(second.input)
+    first.input.set(2)
+    first.input.set(3)
+    first.name = 'source'
+    history.snapshot('Connect')
+    assert second.output.get() == 3
+
+    graph.remove_node(second)
+    assert history.undo().label == ''
+    assert second.graph is graph and second.output.get() == 3
+
+    history.undo()
+    assert second.graph is None and not first.output.outputs
+    assert first.input.get() == 1 and graph.find('first') == [first]
+    history.redo()
+    assert second.output.get() == 3 and first.name == 'source'
+
+    history.restore(initial)
+    assert len(graph.nodes) == 1 and first.input.get() == 1
+    history.restore(history.redo_steps[0])
+    assert second.graph is None
+
+    first.input.set(4)
+    assert not history.redo_steps
+    budget = kukulkan.graph.history.History(graph, budget=5000)
+    for value in xrange(20):
+        first.input.set(numpy.zeros(100) + value)
+        budget.snapshot()
+    assert budget.size <= 5000 and len(budget.undo_steps) == 2
+    budget.undo()
+    assert first.input.get()[0] == 18
+
+    # Removed nodes count the values kept to restore them.
+    heavy = graph.add_node(Counter('heavy'))
+    heavy.input.set(numpy.zeros(1000))
+    budget.snapshot()
+    graph.remove_node(heavy)
+    budget.snapshot()
+    assert budget.undo_steps[-1].size > 8000
+    assert len(budget.undo_steps) == 1
+
+    # Items of lists.
+    budget.close()
+    third = graph.add_node(Counter('third'))
+    items = add_list(third, 'items', kukulkan.graph.api.Attribute, 2)
+    first.output.connect(items[1])
+    history.snapshot('Items')
+    items.append(kukulkan.graph.api.Attribute('items2', third))
+    del items[1]
+    history.snapshot('Edit items')
+    assert [i.name for i in items] == ['items0', 'items2']
+    history.undo()
+    assert [i.name for i in items] == ['items0', 'items1']
+    assert items[1].inputs.values() == [first.output]
+    history.redo()
+    assert [i.name for i in items] == ['items0', 'items2']
+    assert not first.output.outputs
+
+
+def test_parallel_evaluation():
+    for pool in [multiprocessing.pool.ThreadPool(4), multiprocessing.Pool(4)]:
+        graph = kukulkan.graph.api.Graph()
+        for branch in xrange(4):
+            previous = None
+            for index in xrange(3):
+                name = 'counter{}_{}'.format(branch, index)
+                node = graph.add_node(Counter(name))
+                if previous is None:
+                    node.input.set(branch)
+                else:
+                    previous.output.connect(node.input)
+                previous = node
+        with kukulkan.graph.profiler.profile(graph) as profiler:
+            report = graph.evaluate_parallel(pool)
+        pool.close()
+        assert report.widths == [4, 4, 4]
+        assert len(profiler.stats) == 12 and len(profiler.events) == 12
+        assert not graph.dirty_nodes
+        assert previous.output.get() == 3
+        print report
 
 
 def main():
@@ -53,4 +598,19 @@ def main():
 
 
 if __name__ == '__main__':
+    test_dirty_propagation()
+    test_failed_run()
+    test_schedule()
+    test_deep_chain()
+    test_cycle_detection()
+    test_remove_node()
+    test_names()
+    test_batch()
+    test_matrix_store()
+    test_matrix_validation()
+    test_attribute_list()
+    test_profiler()
+    test_compiled_region()
+    test_history()
+    test_parallel_evaluation()
     main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import uuid
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+
+
+class LegacyAttribute(object):
+    """The attribute layout used before compact attributes."""
+
+    def __init__(self, name, node):
+        self.uuid = uuid.uuid4()
+        self.inputs = {}
+        self.outputs = {}
+        self.value = None
+        self.node = node
+        self.name = name
+
+
+def footprint(objects):
+    """Return the memory used by objects and the containers they own."""
+    seen = set()
+    size = 0
+    for obj in objects:
+        owned = [obj, getattr(obj, '__dict__', None)]
+        owned += [getattr(obj, 'inputs', None), getattr(obj, 'outputs', None)]
+        owned.append(getattr(obj, '_uuid', getattr(obj, 'uuid', None)))
+        for item in owned:
+            if item is None or id(item) in seen:
+                continue
+            seen.add(id(item))
+            size += sys.getsizeof(item)
+    return size
+
+
+def benchmark(attribute_class, count):
+    node = kukulkan.graph.api.Node('node')
+    start = time.time()
+    attributes = [attribute_class('attr', node) for _ in xrange(count)]
+    duration = time.time() - start
+    size = footprint(attributes)
+    print '{:<16} {:>8.3f}s {:>10.1f}MB {:>6d}B/attribute'.format(
+        attribute_class.__name__,
+        duration,
+        size / 1024.0 / 1024.0,
+        size / count,
+    )
+
+
+def main(count=100000):
+    print 'Creation of {} attributes:'.format(count)
+    benchmark(LegacyAttribute, count)
+    benchmark(kukulkan.graph.api.Attribute, count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+
+
+class PassThrough(kukulkan.graph.api.Node):
+
+    builtin_attributes = {
+        'input': kukulkan.graph.api.Attribute,
+        'output': kukulkan.graph.api.Attribute,
+    }
+
+    def run(self):
+        self.output.value = self.input.get()
+
+    def compile(self):
+        return ['{output} = {input}']
+
+
+def build_graph(chains, length):
+    """Build ``chains`` independent chains of ``length`` nodes."""
+    graph = kukulkan.graph.api.Graph()
+    roots = []
+    for chain in xrange(chains):
+        previous = None
+        for index in xrange(length):
+            name = 'node_{}_{}'.format(chain, index)
+            node = graph.add_node(PassThrough(name))
+            if previous is None:
+                roots.append(node)
+            else:
+                previous.output.connect(node.input)
+            previous = node
+    return graph, roots
+
+
+def dirty(roots, value):
+    for root in roots:
+        root.input.set(value)
+
+
+def pull_evaluate(graph):
+    """Evaluate the graph without any schedule, pulling from each node."""
+    while graph.dirty_nodes:
+        graph.dirty_nodes.pop().evaluate()
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def benchmark(chains, length):
+    graph, roots = build_graph(chains, length)
+    print '{} chains of {} nodes:'.format(chains, length)
+
+    dirty(roots, 0)
+    print 'Without plan: {:.3f}s'.format(timed(pull_evaluate, graph))
+
+    dirty(roots, 1)
+    print 'Plan compilation: {:.3f}s'.format(timed(graph.schedule))
+    print 'With plan: {:.3f}s'.format(timed(graph.evaluate))
+
+    last = graph.schedule()[-1]
+    assert last.output.get() == 1
+
+    region = graph.compile()
+    print 'Region compilation: {:.3f}s'.format(timed(region.compile))
+    dirty(roots, 2)
+    print 'Compiled: {:.3f}s'.format(timed(region.evaluate))
+    assert last.output.get() == 2 and not graph.dirty_nodes
+
+
+def main():
+    benchmark(100, 100)
+    benchmark(1, 10000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+
+import numpy
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+import kukulkan.graph.hierarchy
+import kukulkan.graph.nodes.transform
+
+
+def random_xform():
+    matrix = numpy.identity(4)
+    matrix[:3, :3] = numpy.linalg.qr(numpy.random.rand(3, 3))[0]
+    matrix[:3, 3] = numpy.random.uniform(-1, 1, 3)
+    return matrix
+
+
+def build_character(joints, chain=20):
+    """Build chains of ``chain`` joints branching off a spine."""
+    graph = kukulkan.graph.api.Graph()
+    transforms = []
+    for index in xrange(joints):
+        transform = kukulkan.graph.nodes.transform.Transform(
+            'joint{}'.format(index)
+        )
+        transform.xform.set(random_xform())
+        if index:
+            if index % chain:
+                transform.parent = transforms[-1]
+            else:
+                transform.parent = transforms[index // chain]
+        graph.add_node(transform)
+        transforms.append(transform)
+    graph.evaluate()
+    return graph, transforms
+
+
+def naive_world(transform):
+    matrix = transform.xform.get()
+    while transform.parent is not None:
+        transform = transform.parent
+        matrix = transform.xform.get().dot(matrix)
+    return matrix
+
+
+def test_solve():
+    graph, transforms = build_character(200)
+    hierarchy = kukulkan.graph.hierarchy.Hierarchy(transforms)
+    for transform in transforms:
+        assert numpy.allclose(transform.world(), naive_world(transform))
+
+    transforms[30].xform.set(random_xform())
+    graph.evaluate()
+    assert hierarchy.dirty.sum() == 10
+    for transform in transforms:
+        assert numpy.allclose(transform.world(), naive_world(transform))
+
+    # Reparenting requires a new hierarchy.
+    transforms[45].parent = transforms[3]
+    try:
+        transforms[45].world()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Solved a hierarchy with a reparented transform.')
+    kukulkan.graph.hierarchy.Hierarchy(transforms)
+    for transform in transforms:
+        assert numpy.allclose(transform.world(), naive_world(transform))
+
+
+def benchmark(joints=2000):
+    graph, transforms = build_character(joints)
+    start = time.time()
+    hierarchy = kukulkan.graph.hierarchy.Hierarchy(transforms)
+    print 'Build hierarchy of {} joints: {:.2f}ms'.format(
+        joints,
+        (time.time() - start) * 1000,
+    )
+
+    pose = numpy.array([random_xform() for _ in xrange(joints)])
+    indices = numpy.arange(joints)
+    start = time.time()
+    hierarchy.set_locals(indices, pose)
+    hierarchy.solve()
+    print 'Full pose: {:.2f}ms'.format((time.time() - start) * 1000)
+
+    start = time.time()
+    transforms[joints // 2].xform.set(random_xform())
+    graph.evaluate()
+    hierarchy.solve()
+    print 'Single joint change: {:.2f}ms'.format((time.time() - start) * 1000)
+
+
+if __name__ == '__main__':
+    test_solve()
+    benchmark()
@@ -0,0 +1,170 @@
+import gc
+import os
+import resource
+import sys
+import time
+import weakref
+
+import numpy
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+import kukulkan.graph.attributes.matrix
+import kukulkan.graph.hierarchy
+import kukulkan.graph.history
+import kukulkan.graph.journal
+import kukulkan.graph.nodes.transform
+import kukulkan.graph.profiler
+
+
+class Blend(kukulkan.graph.api.Node):
+
+    builtin_attributes = {
+        'input': kukulkan.graph.attributes.matrix.XForm,
+        'output': kukulkan.graph.attributes.matrix.XForm,
+    }
+
+    def run(self):
+        self.output.value = self.input.get() * .5
+
+    def compile(self):
+        return ['{output} = {input} * .5']
+
+
+def build_rig(count):
+    """Build a graph using every feature holding references to it."""
+    graph = kukulkan.graph.api.Graph()
+    journal = kukulkan.graph.journal.Journal(graph)
+    history = kukulkan.graph.history.History(graph)
+    transforms = []
+    blend = None
+    for index in xrange(count):
+        transform = kukulkan.graph.nodes.transform.Transform(
+            'trs{}'.format(index),
+        )
+        graph.add_node(transform)
+        if transforms:
+            transform.parent = transforms[-1]
+        previous = blend
+        blend = graph.add_node(Blend('blend{}'.format(index)))
+        transform.xform.connect(blend.input)
+        items = blend.add_attribute('items', kukulkan.graph.api.AttributeList)
+        for item in xrange(2):
+            items.append(kukulkan.graph.attributes.matrix.XForm(
+                'items{}'.format(item),
+                blend,
+            ))
+        if previous is not None:
+            previous.output.connect(items[0])
+        transforms.append(transform)
+    hierarchy = kukulkan.graph.hierarchy.Hierarchy(transforms)
+    transforms[0].xform.set(numpy.identity(4) * 2)
+    history.snapshot('Scale')
+    with kukulkan.graph.profiler.profile(graph):
+        graph.evaluate()
+    graph.compile().evaluate()
+    hierarchy.solve()
+    assert len(journal)
+    return graph
+
+
+def test_no_cycles():
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        graph = build_rig(50)
+        graph_ref = weakref.ref(graph)
+        node_ref = weakref.ref(graph.find('blend10')[0])
+        attribute_ref = weakref.ref(graph.find('blend10')[0].items[1])
+        del graph
+        # Freed by reference counting, the collector finds nothing.
+        assert graph_ref() is None
+        assert node_ref() is None
+        assert attribute_ref() is None
+        assert gc.collect() == 0
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def test_removed_node():
+    graph = kukulkan.graph.api.Graph()
+    for index in xrange(5):
+        graph.add_node(Blend('blend{}'.format(index)))
+    blend, = graph.find('blend3')
+    graph.compile(graph.search('blend*')).evaluate()
+    region_ref = weakref.ref(graph.compile(graph.search('blend*')))
+    whole = graph.compile()
+    whole.evaluate()
+    node_ref = weakref.ref(blend)
+    graph.remove_node(blend)
+    del blend
+    # Compiled regions do not keep removed nodes alive.
+    assert node_ref() is None and region_ref() is None
+    assert graph.compile() is whole
+    whole.evaluate()
+    assert len(whole.nodes) == len(graph.nodes)
+
+
+def test_freed_node():
+    node = Blend('blend')
+    items = node.add_attribute('items', kukulkan.graph.api.AttributeList)
+    attribute = node.output
+    del node
+    # Attributes do not keep their node alive.
+    for item, name in [(attribute, 'output'), (items, 'items')]:
+        try:
+            item.node
+        except ReferenceError as error:
+            assert name in str(error)
+        else:
+            raise AssertionError('The node of {} is alive.'.format(name))
+        assert str(item) == '<freed>.' + name
+
+
+def test_memory_flat(count=2000, iterations=10):
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        build_rig(count)
+        objects = len(gc.get_objects())
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        for _ in xrange(iterations):
+            build_rig(count)
+        assert len(gc.get_objects()) <= objects
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak
+        assert growth < peak * .05, 'Memory grew by {}kB'.format(growth)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def benchmark(count=20000):
+    gc.collect()
+    graph = build_rig(count)
+    start = time.time()
+    del graph
+    print 'Drop a graph of {} transforms: {:.3f}s'.format(
+        count,
+        time.time() - start,
+    )
+    start = time.time()
+    collected = gc.collect()
+    print 'Collect: {:.3f}s, {} objects'.format(time.time() - start, collected)
+
+
+if __name__ == '__main__':
+    test_no_cycles()
+    test_removed_node()
+    test_freed_node()
+    test_memory_flat()
+    benchmark()
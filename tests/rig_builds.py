@@ -0,0 +1,72 @@
+import os
+import shutil
+import sys
+import tempfile
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+scripts = os.path.join(kukulkan_path, 'scripts')
+
+
+sys.path.append(py_kukulkan)
+sys.path.append(scripts)
+
+
+import build_rigs
+
+
+TEMPLATES = '''
+import kukulkan.graph.api
+import kukulkan.graph.nodes.transform
+
+
+def biped(name):
+    graph = kukulkan.graph.api.Graph()
+    graph.add_node(kukulkan.graph.nodes.transform.Transform(name))
+    return graph
+
+
+def broken(name):
+    raise RuntimeError(name)
+'''
+
+
+def test_build_rigs():
+    folder = tempfile.mkdtemp()
+    output = os.path.join(folder, 'rigs')
+    cwd = os.getcwd()
+    path = list(sys.path)
+    try:
+        with open(os.path.join(folder, 'kkg_templates.py'), 'w') as fh:
+            fh.write(TEMPLATES)
+        # Templates are imported from the current folder.
+        os.chdir(folder)
+        code = build_rigs.main([
+            'kkg_templates.biped:alice',
+            'kkg_templates.broken:bob',
+            '--output', output,
+            '--workers', '0',
+        ])
+        assert code == 1
+        assert os.listdir(output) == ['alice.kkg']
+
+        try:
+            build_rigs.main([
+                'kkg_templates.biped:alice',
+                'kkg_templates.broken:alice',
+                '--workers', '0',
+            ])
+        except SystemExit:
+            pass
+        else:
+            raise AssertionError('Two jobs built the same character.')
+    finally:
+        os.chdir(cwd)
+        sys.path[:] = path
+        sys.modules.pop('kkg_templates', None)
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_build_rigs()
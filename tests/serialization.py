@@ -0,0 +1,252 @@
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+
+kukulkan_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+py_kukulkan = os.path.join(kukulkan_path, 'python')
+
+
+sys.path.append(py_kukulkan)
+
+
+import kukulkan.graph.api
+import kukulkan.graph.attributes.matrix
+import kukulkan.graph.journal
+import kukulkan.graph.nodes.transform
+import kukulkan.graph.serialization
+
+
+def build_rig(count):
+    graph = kukulkan.graph.api.Graph()
+    previous = None
+    for index in xrange(count):
+        name = 'trs{}'.format(index)
+        transform = kukulkan.graph.nodes.transform.Transform(name)
+        graph.add_node(transform)
+        if index % 10:
+            previous.xform.connect(transform.xform)
+        else:
+            transform.xform.set(numpy.identity(4) * index)
+        previous = transform
+    return graph
+
+
+def test_round_trip():
+    graph = build_rig(100)
+    node = graph.schedule()[0]
+    node.add_attribute('label', kukulkan.graph.api.Attribute)
+    node.label.set({'side': 'L'})
+    weights = node.add_attribute('weights', kukulkan.graph.api.AttributeList)
+    for index in xrange(3):
+        weights.append(kukulkan.graph.api.Attribute('w{}'.format(index), node))
+        weights[index].set(index * .5)
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'rig.kkg')
+    try:
+        kukulkan.graph.serialization.save(graph, path)
+        loaded = kukulkan.graph.serialization.load(path)
+    finally:
+        shutil.rmtree(folder)
+
+    assert len(loaded.nodes) == len(graph.nodes)
+    nodes = dict((n.uuid, n) for n in loaded.nodes.itervalues())
+    for original in graph.nodes.itervalues():
+        copy = nodes[original.uuid]
+        assert copy.name == original.name
+        assert numpy.array_equal(copy.xform.get(), original.xform.get())
+        assert len(copy.xform.inputs) == len(original.xform.inputs)
+    copy = nodes[node.uuid]
+    assert copy.label.get() == {'side': 'L'}
+    assert [w.get() for w in copy.weights] == [0, .5, 1]
+
+    store = loaded.store(kukulkan.graph.attributes.matrix.XForm)
+    assert isinstance(store.array, numpy.memmap)
+
+
+def test_save_over_loaded_file():
+    graph = build_rig(2000)
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'rig.kkg')
+    try:
+        kukulkan.graph.serialization.save(graph, path)
+        loaded = kukulkan.graph.serialization.load(path)
+        for rig in (graph, loaded):
+            rig.find('trs5')[0].name = 'renamed' * 100
+        kukulkan.graph.serialization.save(loaded, path)
+        assert_same(graph, loaded)
+        kukulkan.graph.serialization.save(loaded, path)
+        assert_same(graph, kukulkan.graph.serialization.load(path))
+        assert os.listdir(folder) == ['rig.kkg']
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_lazy_loading():
+    graph = build_rig(100)
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'rig.kkg')
+    try:
+        kukulkan.graph.serialization.save(graph, path)
+        loaded = kukulkan.graph.serialization.load(path, lazy=True)
+    finally:
+        shutil.rmtree(folder)
+
+    assert len(loaded.nodes) == 100
+    assert not loaded.nodes.loaded
+    node, = loaded.find('trs15')
+    assert len(loaded.nodes.loaded) == 6
+    assert node.xform.get()[0][0] == 10
+    assert node.xform.source().node.name == 'trs10'
+
+    assert len(loaded.search('trs2?')) == 10
+    assert len(loaded.nodes.loaded) == 16
+
+    # Downstream queries build the nodes driven.
+    trs16, = loaded.downstream(node)
+    assert trs16.name == 'trs16' and len(loaded.nodes.loaded) == 17
+    assert [n.name for n in trs16.downstream_nodes()] == ['trs17']
+
+    # Nodes built after a node was removed do not connect to it.
+    loaded.remove_node(loaded.find('trs30')[0])
+    trs31, = loaded.find('trs31')
+    assert not trs31.xform.inputs and not loaded.upstream(trs31)
+
+    assert len(list(loaded.nodes.itervalues())) == 99
+    assert not loaded.nodes.pending
+    assert len(loaded.find('trs15')[0].xform.outputs) == 1
+
+
+def assert_same(graph, other):
+    assert len(graph.nodes) == len(other.nodes)
+    nodes = dict((n.uuid, n) for n in other.nodes.itervalues())
+    for original in graph.nodes.itervalues():
+        copy = nodes[original.uuid]
+        assert copy.name == original.name
+        assert sorted(copy.attribute_names) == sorted(original.attribute_names)
+        assert numpy.array_equal(copy.xform.get(), original.xform.get())
+        sources = [a.node.uuid for a in original.xform.inputs.itervalues()]
+        copies = [a.node.uuid for a in copy.xform.inputs.itervalues()]
+        assert sources == copies
+
+
+def test_journal():
+    graph = build_rig(20)
+    journal = kukulkan.graph.journal.Journal(graph)
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'rig.kkg')
+    patches = [os.path.join(folder, 'rig.{}.patch'.format(i)) for i in (1, 2)]
+    trs3, = graph.find('trs3')
+    weights = trs3.add_attribute('weights', kukulkan.graph.api.AttributeList)
+    for index in xrange(3):
+        weights.append(kukulkan.graph.api.Attribute('w{}'.format(index), trs3))
+        weights[index].set(index)
+    try:
+        journal.compact(path)
+        assert not len(journal)
+
+        # Items inserted in and removed from a list of the base file.
+        weights.append(kukulkan.graph.api.Attribute('w3', trs3))
+        weights[3].set(3)
+        del weights[0]
+        weights.insert(0, kukulkan.graph.api.Attribute('w4', trs3))
+        weights[0].set(4)
+        journal.save_patch(patches[0])
+        loaded = kukulkan.graph.journal.load(path, patches[:1])
+        items = loaded.find('trs3')[0].weights
+        assert [(w.name, w.get()) for w in items] == [
+            ('w4', 4), ('w1', 1), ('w2', 2), ('w3', 3),
+        ]
+        journal.compact(path)
+
+        trs0, = graph.find('trs0')
+        trs1, = graph.find('trs1')
+        trs10, = graph.find('trs10')
+        trs0.xform.set(numpy.identity(4) * 3)
+        trs0.xform.disconnect(trs1.xform)
+        trs1.xform.set(numpy.identity(4) * 2)
+        trs10.add_attribute('label', kukulkan.graph.api.Attribute)
+        trs10.label.set('spine')
+        extra = kukulkan.graph.nodes.transform.Transform('extra')
+        graph.add_node(extra)
+        trs10.xform.connect(extra.xform)
+        trs10.name = 'spine'
+        temporary = kukulkan.graph.nodes.transform.Transform('temporary')
+        graph.add_node(temporary)
+        graph.remove_node(temporary)
+        journal.save_patch(patches[0])
+        assert not len(journal)
+
+        with graph.batch():
+            trs10.remove_attribute('label')
+            trs0.xform.connect(trs1.xform)
+        journal.save_patch(patches[1])
+        with open(patches[1]) as fh:
+            assert 'spine' not in fh.read()
+
+        loaded = kukulkan.graph.journal.load(path, patches)
+        assert_same(graph, loaded)
+        assert not loaded.find('temporary')
+
+        journal.compact(path)
+        assert_same(graph, kukulkan.graph.serialization.load(path))
+
+        # Compacting onto the file a graph was loaded from.
+        loaded = kukulkan.graph.serialization.load(path)
+        journal = kukulkan.graph.journal.Journal(loaded)
+        for rig in (graph, loaded):
+            rig.find('trs2')[0].name = 'renamed' * 100
+        journal.compact(path)
+        assert_same(graph, loaded)
+        assert_same(graph, kukulkan.graph.serialization.load(path))
+    finally:
+        shutil.rmtree(folder)
+
+
+def benchmark(count=20000):
+    graph = build_rig(count)
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'rig.kkg')
+    try:
+        start = time.time()
+        kukulkan.graph.serialization.save(graph, path)
+        print 'Save {} transforms: {:.3f}s, {:.1f}MB'.format(
+            count,
+            time.time() - start,
+            os.path.getsize(path) / 1024.0 / 1024.0,
+        )
+        start = time.time()
+        kukulkan.graph.serialization.load(path)
+        print 'Load: {:.3f}s'.format(time.time() - start)
+        # Free the loaded graph first, not while timing the lazy load.
+        gc.collect()
+        start = time.time()
+        graph = kukulkan.graph.serialization.load(path, lazy=True)
+        graph.find('trs{}'.format(count // 2))
+        print 'Lazy load and find a node: {:.3f}s'.format(time.time() - start)
+        journal = kukulkan.graph.journal.Journal(graph)
+        node, = graph.find('trs{}'.format(count // 2))
+        node.xform.set(numpy.identity(4))
+        patch = os.path.join(folder, 'rig.patch')
+        start = time.time()
+        journal.save_patch(patch)
+        print 'Save a patch of one change: {:.4f}s, {}B'.format(
+            time.time() - start,
+            os.path.getsize(patch),
+        )
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_round_trip()
+    test_save_over_loaded_file()
+    test_lazy_loading()
+    test_journal()
+    benchmark()